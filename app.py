@@ -1,18 +1,43 @@
 # backend/app.py
+import io
 import os
+import re
 import json
+import time
 import uuid
-import shutil
+import hashlib
 import logging
+import threading
 from pathlib import Path
 from datetime import datetime, timezone
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import lru_cache
-from flask import Flask, request, jsonify
+from contextlib import contextmanager
+from cachetools import LRUCache, TTLCache, cached
+from flask import Flask, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
 from werkzeug.utils import secure_filename
 import numpy as np
-from vector_store import search_index
-from classifier import get_embedding, chat_complete, cosine_similarities
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumpb = orjson.dumps
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+    _json_dumpb = lambda obj: json.dumps(obj, separators=(",", ":")).encode()
+from vector_store import avg_cosine_to_corpus, mean_normed, search_index
+from classifier import CHAT_MODEL, CHAT_UNAVAILABLE, EMBED_MODEL, get_embedding, get_embeddings, chat_complete, chat_complete_stream, quantize_embedding
+from vector_ops import cosine_matrix, warmup as warmup_vector_ops
 from dotenv import load_dotenv
 from classifier import build_rag_search_prompt
 from gcp_secrets import get_secret
@@ -24,8 +49,27 @@ load_dotenv()
 # Secrets
 SERPAPI_KEY = get_secret("SERPAPI_KEY", required=False)
 
-# Import your AI functions (assumes classifier.py in same folder)
-from classifier import get_embedding, cosine_similarities, chat_complete
+# Pooled keep-alive session for SerpAPI so repeat searches skip the TCP/TLS handshake
+SERPAPI_URL = "https://serpapi.com/search"
+SERPAPI_SESSION = requests.Session()
+SERPAPI_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                              max_retries=Retry(total=2, backoff_factor=0.3)))
+
+# Resume parsers (optional; PDF/DOCX uploads fail with a clear error without them)
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+try:
+    import docx
+except ImportError:
+    docx = None
+
+# Optional ANN index for RAG retrieval (falls back to a brute-force scan)
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
 
 # Optional notifier if present, import safely
 try:
@@ -39,24 +83,75 @@ except Exception:
 
 # Logging
 logging.basicConfig(level=logging.INFO)
+# classifier configures the root logger first, so set the level explicitly
+logging.getLogger().setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger("jobmatch")
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson; numpy arrays and scalars serialize natively"""
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # App setup
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 CORS(app, resources={r"/api/*": {"origins": "*"}})  # restrict origins in production
+if Compress is not None:
+    Compress(app)  # gzip/brotli, negotiated from Accept-Encoding
 
 # Paths
 BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_DIR = BASE_DIR / "uploads"
 DATA_DIR = BASE_DIR / "data"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+UPLOAD_CHUNK = 1024 * 1024  # write uploads in 1 MB blocks (Werkzeug's default is 16 KB)
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-# Simple SQLite DB
+# Simple SQLite DB (one connection per thread, WAL so readers don't block the writer)
 import sqlite3
 DB_PATH = DATA_DIR / "jobmatch.db"
-conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
-c = conn.cursor()
+_db_local = threading.local()
+
+def _get_conn():
+    """Return this thread's SQLite connection, opening and tuning it on first use"""
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(str(DB_PATH), isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+        _db_local.conn = conn
+    return conn
+
+@contextmanager
+def tx():
+    """Run the enclosed writes in one transaction (one fsync); nested use joins the outer one"""
+    conn = _get_conn()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def _join_skills(skills):
+    """Serialize a skills list as "|"-delimited text (cheaper to read back than JSON)"""
+    return "|".join(str(s).replace("|", "/") for s in skills) if skills else None
+
+c = _get_conn().cursor()
 c.execute("""CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, username TEXT UNIQUE, password TEXT, role TEXT, name TEXT)""")
 c.execute("""CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, title TEXT, description TEXT, skills TEXT, questions TEXT, created_by TEXT, responsibilities TEXT, qualifications TEXT, company_name TEXT, hr_email TEXT)""")
 # Add new columns if they don't exist (migration for existing databases)
@@ -76,26 +171,457 @@ try:
     c.execute("ALTER TABLE jobs ADD COLUMN hr_email TEXT")
 except sqlite3.OperationalError:
     pass  # Column already exists
+try:
+    c.execute("ALTER TABLE jobs ADD COLUMN embedding BLOB")
+except sqlite3.OperationalError:
+    pass  # Column already exists
+# Job embeddings are stored as float16 (schema version 1); convert rows written as float32
+if c.execute("PRAGMA user_version").fetchone()[0] < 1:
+    for _jid, _blob in c.execute("SELECT id, embedding FROM jobs WHERE embedding IS NOT NULL").fetchall():
+        c.execute("UPDATE jobs SET embedding=? WHERE id=?",
+                  (np.frombuffer(_blob, dtype=np.float32).astype(np.float16).tobytes(), _jid))
+    c.execute("PRAGMA user_version = 1")
+# Resolve the jobs schema once so list_jobs can use a single SELECT
+JOB_COLUMNS = frozenset(row[1] for row in c.execute("PRAGMA table_info(jobs)"))
+_JOB_FIELDS = ("id", "title", "description", "skills", "questions", "created_by",
+               "responsibilities", "qualifications", "company_name", "hr_email")
+_LIST_JOBS_SQL = "SELECT " + ",".join(f if f in JOB_COLUMNS else "NULL" for f in _JOB_FIELDS) + " FROM jobs"
+# Skills are stored as "|"-delimited text; rewrite rows still holding the old JSON arrays
+for _jid, _skills in c.execute("SELECT id, skills FROM jobs WHERE skills LIKE '[%'").fetchall():
+    try:
+        c.execute("UPDATE jobs SET skills=? WHERE id=?", (_join_skills(json.loads(_skills)), _jid))
+    except (ValueError, TypeError):
+        pass  # Leave malformed rows as they are
 c.execute("""CREATE TABLE IF NOT EXISTS resumes (id TEXT PRIMARY KEY, user_id TEXT, filename TEXT, text TEXT, uploaded_at TEXT)""")
+try:
+    c.execute("ALTER TABLE resumes ADD COLUMN status TEXT")
+except sqlite3.OperationalError:
+    pass  # Column already exists
+try:
+    c.execute("ALTER TABLE resumes ADD COLUMN content_hash TEXT")
+except sqlite3.OperationalError:
+    pass  # Column already exists
+c.execute("""CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, vec BLOB)""")
+c.execute("""CREATE TABLE IF NOT EXISTS query_cache (key TEXT PRIMARY KEY, query TEXT)""")
+# Job version, bumped by triggers on any job or stored-vector change so every worker process sees the same value
+c.execute("""CREATE TABLE IF NOT EXISTS jobs_state (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)""")
+c.execute("INSERT OR IGNORE INTO jobs_state (id, version) VALUES (0, 0)")
+c.execute("DROP TRIGGER IF EXISTS jobs_version_update")  # older trigger that skipped embedding updates
+_JOB_VERSION_TRIGGERS = {"jobs_version_insert": "INSERT", "jobs_version_delete": "DELETE",
+                         "jobs_version_update_v2": "UPDATE OF " + ", ".join(f for f in _JOB_FIELDS + ("embedding",) if f != "id")}
+for _name, _event in _JOB_VERSION_TRIGGERS.items():
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS {_name} AFTER {_event} ON jobs
+                  BEGIN UPDATE jobs_state SET version = version + 1 WHERE id = 0; END""")
 c.execute("""CREATE TABLE IF NOT EXISTS applications (id TEXT PRIMARY KEY, user_id TEXT, job_id TEXT, answers TEXT, score REAL, status TEXT, submitted_at TEXT)""")
-conn.commit()
+# Indexes for the hot lookups (users.username is already covered by its UNIQUE constraint)
+c.execute("CREATE INDEX IF NOT EXISTS idx_resumes_user_time ON resumes(user_id, uploaded_at DESC)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_applications_job ON applications(job_id)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_applications_user ON applications(user_id)")
+c.execute("CREATE INDEX IF NOT EXISTS idx_resumes_content_hash ON resumes(content_hash)")
+c.execute("ANALYZE")
+
+# Embedding cache to avoid repeated calls; vectors are kept L2-normalized as int8
+# plus a per-vector scale (a quarter of the float32 footprint) and handed out as unit float32.
+# Misses fall through to the embedding_cache table (float16, survives restarts) before the API.
+_EMBED_CACHE = LRUCache(maxsize=1024)
+_embed_cache_lock = threading.Lock()
+
+def _embed_key(text: str) -> str:
+    return hashlib.sha256(f"{EMBED_MODEL}\x00{text}".encode("utf-8", "ignore")).hexdigest()
+
+def _load_embeddings(texts):
+    """Quantized entries for the texts found in the persistent embedding cache"""
+    keys = {_embed_key(t): t for t in texts}
+    key_list = list(keys)
+    found = {}
+    for start in range(0, len(key_list), 500):  # stay under SQLite's bound-parameter limit
+        chunk = key_list[start:start + 500]
+        rows = _get_conn().execute(
+            f"SELECT key, vec FROM embedding_cache WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+        for key, blob in rows:
+            found[keys[key]] = quantize_embedding(np.frombuffer(blob, dtype=np.float16).astype(np.float32))
+    return found
+
+def _persist_embeddings(vectors):
+    """Write {text: vector} to the persistent cache (failed all-zero vectors are skipped)"""
+    rows = []
+    for text, v in vectors.items():
+        v = np.asarray(v, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        if norm:
+            rows.append((_embed_key(text), (v / norm).astype(np.float16).tobytes()))
+    if rows:
+        with tx() as conn:
+            conn.executemany("INSERT OR REPLACE INTO embedding_cache (key, vec) VALUES (?,?)", rows)
+
+def quantized_embedding(text: str, refresh: bool = False):
+    """Cached (int8, scale) embedding; refresh skips every cache layer and overwrites them"""
+    hit = None
+    if not refresh:
+        with _embed_cache_lock:
+            hit = _EMBED_CACHE.get(text)
+    if hit is None:
+        hit = None if refresh else _load_embeddings([text]).get(text)
+        if hit is None:
+            v = get_embedding(text, refresh=refresh)
+            _persist_embeddings({text: v})
+            hit = quantize_embedding(v)
+        with _embed_cache_lock:
+            _EMBED_CACHE[text] = hit
+    return hit
+
+def _unit_vector(entry):
+    """Dequantize a cached (int8, scale) entry to a unit-length float32 vector (zeros stay zeros)"""
+    q, scale = entry
+    v = q.astype(np.float32) * scale
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+def cached_get_embedding(text: str, refresh: bool = False):
+    """Unit-length embedding, so cosine similarity against other cached vectors is a dot product"""
+    return _unit_vector(quantized_embedding(text, refresh))
+
+# Resume vectors shared by /api/match and /api/rag-search for follow-up requests
+_RESUME_VEC_CACHE = TTLCache(maxsize=512, ttl=600)
+_resume_vec_lock = threading.Lock()
+
+def resume_vector(user_id, resume_text: str, cache_key: str = ""):
+    """Unit-length resume embedding, cached per (user_id, content hash, caller cache key) for ten minutes.
+    The first request with a new cache_key re-embeds the resume, bypassing the shared embedding caches."""
+    key = (user_id, hashlib.blake2b(resume_text.encode("utf-8", "ignore"), digest_size=16).digest(), cache_key)
+    with _resume_vec_lock:
+        vec = _RESUME_VEC_CACHE.get(key)
+    if vec is None:
+        vec = cached_get_embedding(resume_text, refresh=bool(cache_key))
+        vec.setflags(write=False)  # shared across requests
+        with _resume_vec_lock:
+            _RESUME_VEC_CACHE[key] = vec
+    return vec
+
+def batch_get_embeddings(texts):
+    """Cached embeddings for many texts as an (N, D) array; misses go out in one batch request"""
+    with _embed_cache_lock:
+        found = {t: _EMBED_CACHE[t] for t in texts if t in _EMBED_CACHE}
+    missing = list(dict.fromkeys(t for t in texts if t not in found))
+    if missing:
+        fresh = _load_embeddings(missing)
+        unseen = [t for t in missing if t not in fresh]
+        if unseen:
+            vectors = dict(zip(unseen, get_embeddings(unseen)))
+            _persist_embeddings(vectors)
+            fresh.update((t, quantize_embedding(v)) for t, v in vectors.items())
+        with _embed_cache_lock:
+            _EMBED_CACHE.update(fresh)
+        found.update(fresh)
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    # Dequantize each distinct text once, then scatter rows back to every position it occupies
+    desc_to_indices = defaultdict(list)
+    for i, t in enumerate(texts):
+        desc_to_indices[t].append(i)
+    rows = [_unit_vector(found[t]) for t in desc_to_indices]
+    dim = max(r.shape[0] for r in rows)  # empty texts embed as zeros of a default width
+    unique = np.vstack([r if r.shape[0] == dim else np.zeros(dim, dtype=np.float32) for r in rows])
+    order = np.empty(len(texts), dtype=np.intp)
+    for u, indices in enumerate(desc_to_indices.values()):
+        order[indices] = u
+    return unique[order]
+
+def build_full_job_desc(job_desc, skills, responsibilities, qualifications):
+    """Combine all job requirements into the description used for matching"""
+    parts = [job_desc or ""]
+    if skills and isinstance(skills, list):
+        parts.append("Required Skills: " + ", ".join(skills))
+    if responsibilities and isinstance(responsibilities, list):
+        parts.append("Responsibilities:\n" + "\n".join(responsibilities))
+    if qualifications and isinstance(qualifications, list):
+        parts.append("Qualifications:\n" + "\n".join(qualifications))
+    return "\n\n".join(parts)
+
+def serpapi_description(item):
+    """SerpAPI job description with its qualification/responsibility highlights appended"""
+    parts = [item.get("description", "")]
+    highlights = item.get("job_highlights", {})
+    if isinstance(highlights, dict):
+        for key in ("Qualifications", "Responsibilities"):
+            section = highlights.get(key, [])
+            if section:
+                parts.append("\n".join(section if isinstance(section, list) else [str(section)]))
+    return "\n".join(parts)
+
+# Job text sent to the embedder is capped (~512 tokens); the tail adds cost, not signal
+EMBED_MAX_CHARS = int(os.getenv("EMBED_MAX_CHARS", "2000"))
+
+def compute_job_embedding(description, skills, responsibilities=None, qualifications=None):
+    """L2-normalized float32 embedding of a job's full description (None if unavailable)"""
+    text = build_full_job_desc(description, skills, responsibilities, qualifications)
+    if not text.strip():
+        return None
+    v = _unit_vector(quantized_embedding(text[:EMBED_MAX_CHARS]))
+    return v if v.any() else None
+
+# Stored job embeddings stacked into one contiguous (N, D) matrix, row i <-> JOB_IDS[i].
+# The matrix is mirrored to JOB_EMB_PATH and memory-mapped read-only, so workers share
+# the pages and the match product runs in BLAS without holding the GIL.
+JOB_EMB_PATH = DATA_DIR / "jobs_emb.bin"
+JOB_IDS = []
+JOB_ROWS = {}
+JOB_EMB = np.zeros((0, 0), dtype=np.float32)
+JOB_INDEX = None
+JOB_MEAN = None  # centroid of the stored job rows, for avg_cosine_to_corpus
+JOB_EMB_VERSION = None  # jobs_version() the state above was loaded at
+_job_emb_lock = threading.Lock()
+_job_refresh_lock = threading.Lock()
+
+def _write_job_emb_mmap(mat):
+    """Atomically rewrite JOB_EMB_PATH with mat and return a read-only memmap of it"""
+    tmp = JOB_EMB_PATH.with_name(f"{JOB_EMB_PATH.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        mat.astype(np.float32, copy=False).tofile(tmp)
+        os.replace(tmp, JOB_EMB_PATH)
+        return np.memmap(JOB_EMB_PATH, dtype=np.float32, mode="r", shape=mat.shape)
+    except OSError as e:
+        logger.warning("Could not memory-map job embeddings, keeping them in memory: %s", e)
+        tmp.unlink(missing_ok=True)
+        return mat
+
+def jobs_version():
+    """Current job version (shared through the DB); part of the MATCH_CACHE key so stale results are never served"""
+    return _get_conn().execute("SELECT version FROM jobs_state WHERE id = 0").fetchone()[0]
+
+def refresh_job_embeddings():
+    """Reload stored job embeddings from the DB into JOB_EMB / JOB_IDS / JOB_INDEX"""
+    global JOB_IDS, JOB_ROWS, JOB_EMB, JOB_INDEX, JOB_MEAN, JOB_EMB_VERSION
+    version = jobs_version()  # read before the rows: a write in between just triggers another rebuild
+    cur = _get_conn().cursor()
+    cur.execute("SELECT id, embedding FROM jobs WHERE embedding IS NOT NULL")
+    ids, vecs = [], []
+    for jid, blob in cur.fetchall():
+        v = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+        if vecs and v.shape != vecs[0].shape:
+            continue  # embedded by a different model; recomputed on the next match
+        ids.append(jid)
+        vecs.append(v)
+    mat = _write_job_emb_mmap(np.vstack(vecs)) if vecs else np.zeros((0, 0), dtype=np.float32)
+    index = _build_job_index(mat)
+    mean = mean_normed(mat)
+    with _job_emb_lock:
+        JOB_IDS, JOB_ROWS, JOB_EMB, JOB_INDEX, JOB_MEAN = ids, {jid: i for i, jid in enumerate(ids)}, mat, index, mean
+        JOB_EMB_VERSION = version
+
+def sync_job_embeddings():
+    """Reload the stored job state if the jobs changed since the last refresh (e.g. in another worker)"""
+    if jobs_version() == JOB_EMB_VERSION:
+        return
+    with _job_refresh_lock:
+        if jobs_version() != JOB_EMB_VERSION:
+            refresh_job_embeddings()
+
+def _build_job_index(mat):
+    """HNSW inner-product index over the (unit-length) job rows; labels are row numbers"""
+    if hnswlib is None or not len(mat):
+        return None
+    index = hnswlib.Index(space="ip", dim=mat.shape[1])
+    index.init_index(max_elements=len(mat), ef_construction=200, M=16)
+    index.add_items(np.asarray(mat), np.arange(len(mat)))
+    return index
+
+def nearest_jobs(vec, k):
+    """(JOB_ROWS, {job_id: similarity}) for the k nearest stored jobs, or None without an index"""
+    sync_job_embeddings()
+    with _job_emb_lock:
+        ids, rows, index = JOB_IDS, JOB_ROWS, JOB_INDEX
+    k = min(k, len(ids))
+    if index is None or k <= 0 or index.dim != vec.shape[0] or not vec.any():
+        return None
+    index.set_ef(max(50, k))
+    labels, distances = index.knn_query(vec, k=k)
+    # hnswlib's "ip" distance is 1 - dot product
+    return rows, {ids[label]: 1.0 - float(dist) for label, dist in zip(labels[0], distances[0])}
+
+def job_embeddings():
+    """Return a consistent, current (JOB_ROWS, JOB_EMB) snapshot"""
+    sync_job_embeddings()
+    with _job_emb_lock:
+        return JOB_ROWS, JOB_EMB
+
+def compute_matches(resume_emb, jobs, descs):
+    """Resume similarity for every job, in job order"""
+    job_rows, stored_emb = job_embeddings()
+    if resume_emb.any() and stored_emb.shape[1:] == resume_emb.shape:
+        rows = np.fromiter((job_rows.get(j.get("id"), -1) for j in jobs), dtype=np.intp, count=len(jobs))
+    else:
+        rows = np.full(len(jobs), -1, dtype=np.intp)
+    stored = rows >= 0
+    sims = np.zeros(len(jobs), dtype=np.float32)
+    if stored.any():
+        sims[stored] = stored_emb[rows[stored]] @ resume_emb
+    fresh = np.flatnonzero(~stored)
+    if len(fresh) and resume_emb.any():
+        # The rest are embedded together (duplicate descriptions once) and scored in one pass
+        fresh_emb = batch_get_embeddings([descs[i][:EMBED_MAX_CHARS] for i in fresh])
+        if fresh_emb.shape[1:] == resume_emb.shape:
+            sims[fresh] = cosine_matrix(resume_emb, fresh_emb)
+    return sims
+
+def _jobs_changed():
+    """Refresh derived job state; deferred to the caller while a bulk transaction is open"""
+    clear_question_caches()
+    if not _get_conn().in_transaction:
+        refresh_job_embeddings()
+
+def _embedding_blob(emb):
+    """Stored form of a job embedding: float16 bytes (half the size, same top-k ordering)"""
+    return emb.astype(np.float16).tobytes() if emb is not None else None
+
+def store_job_embedding(job_id, emb):
+    _get_conn().execute("UPDATE jobs SET embedding=? WHERE id=?", (_embedding_blob(emb), job_id))
+
+# Search query / SerpAPI caches so repeat matches skip the LLM and network round-trips
+_QUERY_CACHE = TTLCache(maxsize=512, ttl=3600)
+_SERPAPI_CACHE = TTLCache(maxsize=256, ttl=3600)
+_query_cache_lock = threading.Lock()
+_serpapi_cache_lock = threading.Lock()
+
+def _preview_key(resume_preview: str) -> str:
+    return hashlib.blake2b(resume_preview.encode("utf-8", "ignore"), digest_size=16).hexdigest()
+
+@cached(_QUERY_CACHE, key=_preview_key, lock=_query_cache_lock)
+def _extract_query(resume_preview: str) -> str:
+    """Ask the LLM for a short (3-5 word) job search query for a resume preview"""
+    query_prompt = f"""You are a job search assistant. Analyze this resume and extract a SPECIFIC job search query.
 
-# Embedding cache to avoid repeated calls
-@lru_cache(maxsize=1024)
-def cached_get_embedding(text: str):
-    return get_embedding(text)
+Resume:
+{resume_preview}
 
-def clear_embedding_cache():
-    cached_get_embedding.cache_clear()
+Based on this resume, create a job search query (3-5 words) that would find the most relevant jobs.
+...
+Return ONLY the search query (3-5 words), nothing else. No explanation, no quotes, just the query.
+"""
+    query = chat_complete(query_prompt).strip()
+    if query == CHAT_UNAVAILABLE:
+        raise RuntimeError("LLM unavailable")  # not cached; the caller falls back to keywords
+    # Clean up: remove quotes, markdown, prefixes
+    query = query.replace('"', '').replace("'", '').strip()
+    if query.lower().startswith('query:'):
+        query = query[6:].strip()
+    if query.startswith('```'):
+        lines = query.split('\n')
+        query = '\n'.join(lines[1:-1]).strip()
+    # Limit to first 50 chars and 3-5 words
+    words = query.split()[:5]
+    query = ' '.join(words)[:50]
+    if not query or len(query) < 3:
+        query = "software engineer"  # Fallback
+    return query
+
+# Finished /api/match responses keyed on (user_id, resume_id, jobs_version, location, job_type).
+# Expires with the SerpAPI cache so external listings are refreshed at the same rate.
+MATCH_CACHE = TTLCache(maxsize=1024, ttl=3600)
+_match_cache_lock = threading.Lock()
+
+# Keyword heuristics for search queries; each is a single regex pass over the resume
+_TITLE_RE = re.compile(r"\b(engineer|developer|analyst|scientist|manager|designer|architect|consultant|specialist)\b", re.IGNORECASE)
+# Specific skills only: generic words like "data" or "ai" appear in nearly every resume
+_SKILL_RE = re.compile(r"\b(python|java|react|javascript|typescript|sql|machine learning|aws|azure|kubernetes)\b", re.IGNORECASE)
+_HEADLINE_LINES = 5  # the name/headline block where a resume states its own title
+_MIN_SKILL_MENTIONS = 2
+
+def extract_query_fast(resume_text: str):
+    """'Title Skill' search query from keywords, or None if the resume lacks a clear pair"""
+    head = "\n".join([line for line in resume_text.splitlines() if line.strip()][:_HEADLINE_LINES])
+    title = _TITLE_RE.search(head)
+    if not title:
+        return None
+    counts = Counter(m.lower() for m in _SKILL_RE.findall(resume_text))
+    if not counts:
+        return None
+    skill, mentions = counts.most_common(1)[0]
+    if mentions < _MIN_SKILL_MENTIONS:
+        return None
+    return f"{title.group(1).title()} {skill.title()}"
+
+# /api/rag-search query extraction, cached in memory and in the query_cache table
+_RAG_QUERY_CACHE = LRUCache(maxsize=512)
+_rag_query_cache_lock = threading.Lock()
+
+def _rag_query_key(resume_preview: str) -> str:
+    return hashlib.sha256(f"{CHAT_MODEL}\x00{resume_preview}".encode("utf-8", "ignore")).hexdigest()
+
+@cached(_RAG_QUERY_CACHE, key=_rag_query_key, lock=_rag_query_cache_lock)
+def _resume_to_query(resume_preview: str) -> str:
+    """Ask the LLM for a 3-5 word job search query; cleaned, empty if unusable"""
+    key = _rag_query_key(resume_preview)
+    row = _get_conn().execute("SELECT query FROM query_cache WHERE key=?", (key,)).fetchone()
+    if row:
+        return row[0]
+    query_prompt = f"""You are a job search assistant. Analyze this resume and extract a SPECIFIC job search query.
+
+Resume:
+{resume_preview}
+
+Based on this resume, create a job search query (3-5 words) that would find the most relevant jobs.
+Focus on:
+1. Job title/role mentioned or implied
+2. Primary technology/skill/domain
+3. Experience level if apparent
+
+Examples:
+- "Software Engineer Python" for Python developers
+- "Data Scientist Machine Learning" for ML data scientists
+- "Product Manager SaaS" for product managers in SaaS
+- "Marketing Manager Digital" for digital marketing managers
+
+IMPORTANT: Make it SPECIFIC to this resume. If resume mentions "React developer", use "React Developer" not generic "software engineer".
+If resume mentions "Data Analyst SQL", use "Data Analyst SQL" not just "Data Analyst".
+
+Return ONLY the search query (3-5 words), nothing else. No explanation, no quotes, just the query.
+"""
+    # No prompt-keyword stand-in: whatever comes back here is persisted in query_cache
+    raw = chat_complete(query_prompt, keyword_fallback=False).strip()
+    if raw == CHAT_UNAVAILABLE:
+        raise RuntimeError("LLM unavailable")  # not cached; the caller falls back to keywords
+    # Clean up the query
+    query = raw.replace('"', '').replace("'", '').strip()
+    # Remove common prefixes
+    for prefix in ["Query:", "Search:", "Jobs:", "The query is:", "Query is:"]:
+        if query.lower().startswith(prefix.lower()):
+            query = query[len(prefix):].strip()
+
+    # Extract first 5 meaningful words
+    words = [w for w in query.split() if len(w) > 2][:5]
+    query = ' '.join(words)[:50]
+    if len(query) >= 3:
+        with tx() as conn:
+            conn.execute("INSERT OR REPLACE INTO query_cache (key, query) VALUES (?,?)", (key, query))
+    return query
+
+@cached(_SERPAPI_CACHE, lock=_serpapi_cache_lock)
+def _serpapi_search(query: str, location: str):
+    """Return SerpAPI google_jobs results for a query (cached for an hour)"""
+    params = {
+        "engine": "google_jobs",
+        "q": query,
+        "api_key": SERPAPI_KEY,
+        "location": location,
+        "num": 20
+    }
+    r = SERPAPI_SESSION.get(SERPAPI_URL, params=params, timeout=30)
+    r.raise_for_status()
+    data = r.json() or {}
+    return data.get("jobs_results", []) or []
 
 # Utility: extract text safely from uploaded file
 def extract_text_from_file(path: Path) -> str:
     ext = path.suffix.lower()
     try:
         if ext == ".pdf":
-            # pypdf extraction
-            from pypdf import PdfReader
-            reader = PdfReader(str(path))
+            # pypdf extraction (parse from memory: one read instead of many small seeks)
+            if PdfReader is None:
+                raise RuntimeError("pypdf is not installed; cannot read PDF resumes")
+            with open(path, "rb") as f:
+                data = f.read()
+            reader = PdfReader(io.BytesIO(data))
             pages = []
             for p in reader.pages:
                 t = p.extract_text()
@@ -103,8 +629,11 @@ def extract_text_from_file(path: Path) -> str:
                     pages.append(t)
             return "\n".join(pages)
         elif ext in [".docx", ".doc"]:
-            import docx
-            doc = docx.Document(str(path))
+            if docx is None:
+                raise RuntimeError("python-docx is not installed; cannot read DOCX resumes")
+            with open(path, "rb") as f:
+                data = f.read()
+            doc = docx.Document(io.BytesIO(data))
             return "\n".join([p.text for p in doc.paragraphs if p.text])
         else:
             # treat as text
@@ -118,50 +647,57 @@ def extract_text_from_file(path: Path) -> str:
 def register_user(username, password, role, name):
     uid = str(uuid.uuid4())
     try:
-        conn.execute("INSERT INTO users (id, username, password, role, name) VALUES (?,?,?,?,?)",
-                     (uid, username, password, role, name))
-        conn.commit()
+        _get_conn().execute("INSERT INTO users (id, username, password, role, name) VALUES (?,?,?,?,?)",
+                            (uid, username, password, role, name))
         return True, uid
     except sqlite3.IntegrityError:
         return False, "Username exists"
 
 def authenticate(username, password):
-    cur = conn.cursor()
+    cur = _get_conn().cursor()
     cur.execute("SELECT id, role, name FROM users WHERE username=? AND password=?", (username, password))
     row = cur.fetchone()
     if not row:
         return None
     return {"id": row[0], "role": row[1], "name": row[2], "username": username}
 
-def save_job(title, description, skills, questions, created_by, responsibilities=None, qualifications=None, company_name=None, hr_email=None):
+def save_job(title, description, skills, questions, created_by, responsibilities=None, qualifications=None, company_name=None, hr_email=None, emb=None):
+    """Insert a job; emb is its precomputed embedding (computed here when None)"""
     jid = str(uuid.uuid4())
-    conn.execute("INSERT INTO jobs (id, title, description, skills, questions, created_by, responsibilities, qualifications, company_name, hr_email) VALUES (?,?,?,?,?,?,?,?,?,?)",
-                 (jid, title, description, json.dumps(skills), json.dumps(questions) if questions else None, created_by, 
-                  json.dumps(responsibilities) if responsibilities else None, json.dumps(qualifications) if qualifications else None,
-                  company_name or None, hr_email or None))
-    conn.commit()
+    if emb is None:
+        emb = compute_job_embedding(description, skills, responsibilities, qualifications)
+    with tx() as conn:
+        conn.execute("INSERT INTO jobs (id, title, description, skills, questions, created_by, responsibilities, qualifications, company_name, hr_email, embedding) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                     (jid, title, description, _join_skills(skills), json.dumps(questions) if questions else None, created_by, 
+                      json.dumps(responsibilities) if responsibilities else None, json.dumps(qualifications) if qualifications else None,
+                      company_name or None, hr_email or None, _embedding_blob(emb)))
+    _jobs_changed()
     return jid
 
 def update_job(job_id, title, description, skills, responsibilities=None, qualifications=None, company_name=None, hr_email=None):
     """Update an existing job"""
-    conn.execute("""UPDATE jobs SET title=?, description=?, skills=?, responsibilities=?, qualifications=?, company_name=?, hr_email=? 
-                   WHERE id=?""",
-                 (title, description, json.dumps(skills), 
-                  json.dumps(responsibilities) if responsibilities else None,
-                  json.dumps(qualifications) if qualifications else None,
-                  company_name or None, hr_email or None, job_id))
-    conn.commit()
+    emb = compute_job_embedding(description, skills, responsibilities, qualifications)
+    with tx() as conn:
+        conn.execute("""UPDATE jobs SET title=?, description=?, skills=?, responsibilities=?, qualifications=?, company_name=?, hr_email=?, embedding=? 
+                       WHERE id=?""",
+                     (title, description, _join_skills(skills), 
+                      json.dumps(responsibilities) if responsibilities else None,
+                      json.dumps(qualifications) if qualifications else None,
+                      company_name or None, hr_email or None,
+                      _embedding_blob(emb), job_id))
+    _jobs_changed()
     return True
 
 def delete_job(job_id):
     """Delete a job by ID"""
-    conn.execute("DELETE FROM jobs WHERE id=?", (job_id,))
-    conn.commit()
+    with tx() as conn:
+        conn.execute("DELETE FROM jobs WHERE id=?", (job_id,))
+    _jobs_changed()
     return True
 
 def get_job_by_id(job_id):
     """Get a single job by ID"""
-    cur = conn.cursor()
+    cur = _get_conn().cursor()
     cur.execute("SELECT id,title,description,skills,questions,created_by,responsibilities,qualifications,company_name,hr_email FROM jobs WHERE id=?", (job_id,))
     r = cur.fetchone()
     if not r:
@@ -170,7 +706,7 @@ def get_job_by_id(job_id):
         "id": r[0],
         "title": r[1],
         "description": r[2],
-        "skills": json.loads(r[3]) if r[3] else [],
+        "skills": r[3].split("|") if r[3] else [],
         "questions": json.loads(r[4]) if r[4] else None,
         "created_by": r[5],
         "responsibilities": json.loads(r[6]) if len(r) > 6 and r[6] else [],
@@ -179,97 +715,136 @@ def get_job_by_id(job_id):
         "hr_email": r[9] if len(r) > 9 and r[9] else None
     }
 
-def list_jobs():
-    cur = conn.cursor()
-    # Try to select with new columns, fallback to old schema if they don't exist
-    try:
-        cur.execute("SELECT id,title,description,skills,questions,created_by,responsibilities,qualifications,company_name,hr_email FROM jobs")
-        rows = cur.fetchall()
-        out = []
-        for r in rows:
-            out.append({
-                "id": r[0],
-                "title": r[1],
-                "description": r[2],
-                "skills": json.loads(r[3]) if r[3] else [],
-                "questions": json.loads(r[4]) if r[4] else None,
-                "created_by": r[5],
-                "responsibilities": json.loads(r[6]) if len(r) > 6 and r[6] else [],
-                "qualifications": json.loads(r[7]) if len(r) > 7 and r[7] else [],
-                "company_name": r[8] if len(r) > 8 and r[8] else None,
-                "hr_email": r[9] if len(r) > 9 and r[9] else None
-            })
-    except sqlite3.OperationalError:
-        # Old schema - migrate on the fly
-        try:
-            cur.execute("SELECT id,title,description,skills,questions,created_by,responsibilities,qualifications FROM jobs")
-            rows = cur.fetchall()
-            out = []
-            for r in rows:
-                out.append({
-                    "id": r[0],
-                    "title": r[1],
-                    "description": r[2],
-                    "skills": json.loads(r[3]) if r[3] else [],
-                    "questions": json.loads(r[4]) if r[4] else None,
-                    "created_by": r[5],
-                    "responsibilities": json.loads(r[6]) if len(r) > 6 and r[6] else [],
-                    "qualifications": json.loads(r[7]) if len(r) > 7 and r[7] else [],
-                    "company_name": None,
-                    "hr_email": None
-                })
-        except sqlite3.OperationalError:
-            # Very old schema
-            cur.execute("SELECT id,title,description,skills,questions,created_by FROM jobs")
-            rows = cur.fetchall()
-            out = []
-            for r in rows:
-                out.append({
-                    "id": r[0],
-                    "title": r[1],
-                    "description": r[2],
-                    "skills": json.loads(r[3]) if r[3] else [],
-                    "questions": json.loads(r[4]) if r[4] else None,
-                    "created_by": r[5],
-                    "responsibilities": [],
-                    "qualifications": [],
-                    "company_name": None,
-                    "hr_email": None
-                })
-    return out
-
-def save_resume_to_db(user_id, filename, text):
+def list_jobs(limit=None, offset=0):
+    cur = _get_conn().cursor()
+    if limit is None:
+        cur.execute(_LIST_JOBS_SQL)
+    else:
+        cur.execute(_LIST_JOBS_SQL + " ORDER BY rowid LIMIT ? OFFSET ?", (limit, offset))
+    _loads = _json_loads
+    return [{
+        "id": r[0],
+        "title": r[1],
+        "description": r[2],
+        "skills": r[3].split("|") if r[3] else [],
+        "questions": _loads(r[4]) if r[4] else None,
+        "created_by": r[5],
+        "responsibilities": _loads(r[6]) if r[6] else [],
+        "qualifications": _loads(r[7]) if r[7] else [],
+        "company_name": r[8] or None,
+        "hr_email": r[9] or None
+    } for r in cur.fetchall()]
+
+def save_resume_to_db(user_id, filename, text, status="ready", content_hash=None):
     rid = str(uuid.uuid4())
-    conn.execute("INSERT INTO resumes (id,user_id,filename,text,uploaded_at) VALUES (?,?,?,?,?)",
-                 (rid, user_id, filename, text, datetime.now(timezone.utc).isoformat()))
-    conn.commit()
+    with tx() as conn:
+        conn.execute("INSERT INTO resumes (id,user_id,filename,text,uploaded_at,status,content_hash) VALUES (?,?,?,?,?,?,?)",
+                     (rid, user_id, filename, text, datetime.now(timezone.utc).isoformat(), status, content_hash))
     return rid
 
+def find_resume_text_by_hash(content_hash):
+    """Text already extracted from an identical upload, if any"""
+    cur = _get_conn().cursor()
+    cur.execute("SELECT text FROM resumes WHERE content_hash=? AND text IS NOT NULL LIMIT 1", (content_hash,))
+    r = cur.fetchone()
+    return r[0] if r else None
+
 def get_latest_resume(user_id):
-    cur = conn.cursor()
-    cur.execute("SELECT id, filename, text FROM resumes WHERE user_id=? ORDER BY uploaded_at DESC LIMIT 1", (user_id,))
+    cur = _get_conn().cursor()
+    cur.execute("SELECT id, filename, text FROM resumes WHERE user_id=? AND text IS NOT NULL ORDER BY uploaded_at DESC LIMIT 1", (user_id,))
     r = cur.fetchone()
     if not r:
         return None
     return {"id": r[0], "filename": r[1], "text": r[2]}
 
+# Background resume text extraction so uploads return immediately
+EXTRACTOR = ThreadPoolExecutor(max_workers=4)
+# Shared, bounded pool for outbound LLM and email calls (reused across requests)
+_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_POOL", "8")))
+
+def _process_resume(rid, fp):
+    """Extract text for an uploaded resume and mark its row ready (or failed)"""
+    try:
+        text = extract_text_from_file(fp)
+    except Exception:
+        logger.exception("Resume processing failed for %s", rid)
+        text = ""
+    if not text.strip():
+        logger.warning("Extracted resume text empty for file %s", fp.name)
+        _get_conn().execute("UPDATE resumes SET status='failed' WHERE id=?", (rid,))
+        return
+    _get_conn().execute("UPDATE resumes SET text=?, status='ready' WHERE id=?", (text, rid))
+    logger.info("📄 Processed resume %s: %s -> Extracted %d characters", rid, fp.name, len(text))
+
 def save_application(user_id, job_id, answers, score, status):
     aid = str(uuid.uuid4())
-    conn.execute("INSERT INTO applications (id, user_id, job_id, answers, score, status, submitted_at) VALUES (?,?,?,?,?,?,?)",
-                 (aid, user_id, job_id, json.dumps(answers), score, status, datetime.now(timezone.utc).isoformat()))
-    conn.commit()
+    with tx() as conn:
+        conn.execute("INSERT INTO applications (id, user_id, job_id, answers, score, status, submitted_at) VALUES (?,?,?,?,?,?,?)",
+                     (aid, user_id, job_id, json.dumps(answers), score, status, datetime.now(timezone.utc).isoformat()))
     return aid
 
 def get_applications_for_job(job_id):
-    cur = conn.cursor()
+    cur = _get_conn().cursor()
     cur.execute("SELECT id, user_id, answers, score, status, submitted_at FROM applications WHERE job_id=?", (job_id,))
     return cur.fetchall()
 
 def update_job_questions(job_id, questions):
-    conn.execute("UPDATE jobs SET questions=? WHERE id=?", (json.dumps(questions) if questions else None, job_id))
-    conn.commit()
+    _get_conn().execute("UPDATE jobs SET questions=? WHERE id=?", (json.dumps(questions) if questions else None, job_id))
+    clear_question_caches()
     return True
 
+# Question generation: rendered prompts and generated questions are memoized per
+# (job_id, experience_level, jobs_version()), so a job edited in any worker process misses
+_QUESTIONS_CACHE = TTLCache(maxsize=256, ttl=86400)
+_questions_cache_lock = threading.Lock()
+_JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+
+@lru_cache(maxsize=256)
+def _render_job_context(job_id, experience_level, version):
+    """Render the question-generation prompt for a job (version only keys the cache)"""
+    job = get_job_by_id(job_id) or {}
+    title = job.get("title", "")
+    description = job.get("description", "")
+    skills = job.get("skills", [])
+    responsibilities = job.get("responsibilities", [])
+    qualifications = job.get("qualifications", [])
+    
+    # Build comprehensive job context
+    sections = [f"Job Title: {title}", f"Description: {description}"]
+    if skills:
+        sections.append(f"Required Skills: {', '.join(skills) if isinstance(skills, list) else skills}")
+    if responsibilities:
+        resp_text = '\n'.join(responsibilities) if isinstance(responsibilities, list) else responsibilities
+        sections.append(f"Responsibilities:\n{resp_text}")
+    if qualifications:
+        qual_text = '\n'.join(qualifications) if isinstance(qualifications, list) else qualifications
+        sections.append(f"Qualifications:\n{qual_text}")
+    job_context = "\n\n".join(sections) + "\n\n"
+    
+    return f"""Generate 5-7 technical interview questions for this job posting. The questions should be:
+1. Relevant to the job description and required skills
+2. Appropriate for {experience_level} level candidates
+3. Cover both technical skills and problem-solving abilities
+4. Mix of conceptual and practical questions
+
+Job Details:
+{job_context}
+
+Return the questions as a JSON array of strings. Each question should be clear, specific, and test relevant technical knowledge.
+
+Example format:
+["What is the difference between REST and GraphQL APIs?", "How would you optimize a slow database query?", ...]
+
+Return ONLY the JSON array, no other text:"""
+
+def clear_question_caches():
+    _render_job_context.cache_clear()
+    with _questions_cache_lock:
+        _QUESTIONS_CACHE.clear()
+
+refresh_job_embeddings()
+warmup_vector_ops()
+
 # --- Endpoints ---
 
 @app.get("/api/health")
@@ -278,7 +853,13 @@ def health():
 
 @app.get("/api/jobs")
 def api_list_jobs():
-    return jsonify(list_jobs())
+    """Lists jobs, paginated with ?limit= (default 50, max 200) and ?offset="""
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), 200)
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        return jsonify({"ok": False, "error": "limit and offset must be integers"}), 400
+    return jsonify(list_jobs(limit, offset))
 
 @app.get("/api/jobs/<job_id>")
 def get_job(job_id):
@@ -297,6 +878,34 @@ def get_job(job_id):
      job_data["questions"] = []
     return jsonify(job_data)
 
+def _job_fields(data):
+    """Normalize list-ish job fields from a create/update payload"""
+    # Handle skills - can be array or comma-separated string
+    skills = data.get("skills", [])
+    if isinstance(skills, str):
+        skills = [s.strip() for s in skills.split(",") if s.strip()]
+    elif not isinstance(skills, list):
+        skills = []
+    
+    # Handle responsibilities - can be array or newline-separated string
+    responsibilities = data.get("responsibilities", [])
+    if isinstance(responsibilities, str):
+        responsibilities = [r.strip() for r in responsibilities.split("\n") if r.strip()]
+    elif not isinstance(responsibilities, list):
+        responsibilities = []
+    
+    # Handle qualifications - can be array or newline-separated string
+    qualifications = data.get("qualifications", [])
+    if isinstance(qualifications, str):
+        qualifications = [q.strip() for q in qualifications.split("\n") if q.strip()]
+    elif not isinstance(qualifications, list):
+        qualifications = []
+    
+    # Handle company_name and hr_email
+    company_name = data.get("company_name", "").strip() or None
+    hr_email = data.get("hr_email", "").strip() or None
+    return skills, responsibilities, qualifications, company_name, hr_email
+
 @app.post("/api/jobs")
 def api_create_job():
     """
@@ -324,38 +933,51 @@ def api_create_job():
         if not created_by:
             return jsonify({"ok": False, "error": "created_by is required"}), 400
         
-        # Handle skills - can be array or comma-separated string
-        skills = data.get("skills", [])
-        if isinstance(skills, str):
-            skills = [s.strip() for s in skills.split(",") if s.strip()]
-        elif not isinstance(skills, list):
-            skills = []
-        
-        # Handle responsibilities - can be array or newline-separated string
-        responsibilities = data.get("responsibilities", [])
-        if isinstance(responsibilities, str):
-            responsibilities = [r.strip() for r in responsibilities.split("\n") if r.strip()]
-        elif not isinstance(responsibilities, list):
-            responsibilities = []
-        
-        # Handle qualifications - can be array or newline-separated string
-        qualifications = data.get("qualifications", [])
-        if isinstance(qualifications, str):
-            qualifications = [q.strip() for q in qualifications.split("\n") if q.strip()]
-        elif not isinstance(qualifications, list):
-            qualifications = []
-        
-        # Handle company_name and hr_email
-        company_name = data.get("company_name", "").strip() or None
-        hr_email = data.get("hr_email", "").strip() or None
+        skills, responsibilities, qualifications, company_name, hr_email = _job_fields(data)
         
         jid = save_job(title, description, skills, None, created_by, responsibilities, qualifications, company_name, hr_email)
-        print(f"✅ Created job: {jid} - {title} (Company: {company_name}, HR: {hr_email})")
+        logger.info("✅ Created job: %s - %s (Company: %s, HR: %s)", jid, title, company_name, hr_email)
         return jsonify({"ok": True, "job_id": jid, "message": "Job created successfully"})
     except Exception as e:
         logger.exception("Create job failed: %s", e)
         return jsonify({"ok": False, "error": str(e)}), 500
 
+@app.post("/api/jobs/bulk")
+def api_create_jobs_bulk():
+    """
+    Creates many job postings in a single transaction.
+    Accepts a JSON array of job objects with the same fields as POST /api/jobs.
+    """
+    try:
+        data = request.get_json(force=True)
+        if not isinstance(data, list):
+            return jsonify({"ok": False, "error": "expected a JSON array of jobs"}), 400
+        jobs = []
+        for i, item in enumerate(data):
+            if not isinstance(item, dict):
+                return jsonify({"ok": False, "error": f"job {i}: expected an object"}), 400
+            title = (item.get("title") or "").strip()
+            description = (item.get("description") or "").strip()
+            created_by = (item.get("created_by") or "").strip()
+            if not title or not description or not created_by:
+                return jsonify({"ok": False, "error": f"job {i}: title, description and created_by are required"}), 400
+            jobs.append((title, description, created_by) + _job_fields(item))
+        
+        # Embed everything in batched requests before taking the write lock
+        embs = batch_get_embeddings([build_full_job_desc(description, skills, responsibilities, qualifications)[:EMBED_MAX_CHARS]
+                                     for _, description, _, skills, responsibilities, qualifications, _, _ in jobs])
+        
+        with tx():
+            job_ids = [save_job(title, description, skills, None, created_by, responsibilities, qualifications, company_name, hr_email,
+                                emb=emb if emb.any() else None)
+                       for (title, description, created_by, skills, responsibilities, qualifications, company_name, hr_email), emb in zip(jobs, embs)]
+        _jobs_changed()
+        logger.info("✅ Created %d jobs in bulk", len(job_ids))
+        return jsonify({"ok": True, "job_ids": job_ids, "message": f"{len(job_ids)} jobs created successfully"})
+    except Exception as e:
+        logger.exception("Bulk create jobs failed: %s", e)
+        return jsonify({"ok": False, "error": str(e)}), 500
+
 @app.put("/api/jobs/<job_id>")
 def api_update_job(job_id):
     """Update an existing job"""
@@ -373,33 +995,10 @@ def api_update_job(job_id):
         if not description:
             return jsonify({"ok": False, "error": "description is required"}), 400
         
-        # Handle skills - can be array or comma-separated string
-        skills = data.get("skills", [])
-        if isinstance(skills, str):
-            skills = [s.strip() for s in skills.split(",") if s.strip()]
-        elif not isinstance(skills, list):
-            skills = []
-        
-        # Handle responsibilities
-        responsibilities = data.get("responsibilities", [])
-        if isinstance(responsibilities, str):
-            responsibilities = [r.strip() for r in responsibilities.split("\n") if r.strip()]
-        elif not isinstance(responsibilities, list):
-            responsibilities = []
-        
-        # Handle qualifications
-        qualifications = data.get("qualifications", [])
-        if isinstance(qualifications, str):
-            qualifications = [q.strip() for q in qualifications.split("\n") if q.strip()]
-        elif not isinstance(qualifications, list):
-            qualifications = []
-        
-        # Handle company_name and hr_email
-        company_name = data.get("company_name", "").strip() or None
-        hr_email = data.get("hr_email", "").strip() or None
+        skills, responsibilities, qualifications, company_name, hr_email = _job_fields(data)
         
         update_job(job_id, title, description, skills, responsibilities, qualifications, company_name, hr_email)
-        print(f"✅ Updated job: {job_id} - {title}")
+        logger.info("✅ Updated job: %s - %s", job_id, title)
         return jsonify({"ok": True, "message": "Job updated successfully"})
     except Exception as e:
         logger.exception("Update job failed: %s", e)
@@ -414,7 +1013,7 @@ def api_delete_job(job_id):
             return jsonify({"ok": False, "error": "Job not found"}), 404
         
         delete_job(job_id)
-        print(f"✅ Deleted job: {job_id}")
+        logger.info("✅ Deleted job: %s", job_id)
         return jsonify({"ok": True, "message": "Job deleted successfully"})
     except Exception as e:
         logger.exception("Delete job failed: %s", e)
@@ -431,48 +1030,20 @@ def api_generate_questions(job_id):
         data = request.get_json(force=True) or {}
         experience_level = data.get("experience_level", "mid-level")  # entry, mid-level, senior
         
-        # Extract job details
-        title = job.get("title", "")
-        description = job.get("description", "")
-        skills = job.get("skills", [])
-        responsibilities = job.get("responsibilities", [])
-        qualifications = job.get("qualifications", [])
-        
-        # Build comprehensive job context
-        job_context = f"Job Title: {title}\n\n"
-        job_context += f"Description: {description}\n\n"
-        if skills:
-            job_context += f"Required Skills: {', '.join(skills) if isinstance(skills, list) else skills}\n\n"
-        if responsibilities:
-            resp_text = '\n'.join(responsibilities) if isinstance(responsibilities, list) else responsibilities
-            job_context += f"Responsibilities:\n{resp_text}\n\n"
-        if qualifications:
-            qual_text = '\n'.join(qualifications) if isinstance(qualifications, list) else qualifications
-            job_context += f"Qualifications:\n{qual_text}\n\n"
+        version = jobs_version()
+        cache_key = (job_id, experience_level, version)
+        with _questions_cache_lock:
+            cached_questions = _QUESTIONS_CACHE.get(cache_key)
+        if cached_questions is not None:
+            return jsonify({"ok": True, "questions": list(cached_questions), "job_id": job_id})
         
-        # Generate questions using AI
-        prompt = f"""Generate 5-7 technical interview questions for this job posting. The questions should be:
-1. Relevant to the job description and required skills
-2. Appropriate for {experience_level} level candidates
-3. Cover both technical skills and problem-solving abilities
-4. Mix of conceptual and practical questions
-
-Job Details:
-{job_context}
-
-Return the questions as a JSON array of strings. Each question should be clear, specific, and test relevant technical knowledge.
-
-Example format:
-["What is the difference between REST and GraphQL APIs?", "How would you optimize a slow database query?", ...]
-
-Return ONLY the JSON array, no other text:"""
+        skills = job.get("skills", [])
+        prompt = _render_job_context(job_id, experience_level, version)
         
         try:
             response = chat_complete(prompt)
-            # Try to parse JSON from response
-            import re
             # Extract JSON array from response
-            json_match = re.search(r'\[.*\]', response, re.DOTALL)
+            json_match = _JSON_ARRAY_RE.search(response)
             if json_match:
                 questions_json = json_match.group(0)
                 questions = json.loads(questions_json)
@@ -492,8 +1063,10 @@ Return ONLY the JSON array, no other text:"""
                 questions.extend(generic_questions[:5-len(questions)])
             
             # Save questions to job
-            conn.execute("UPDATE jobs SET questions=? WHERE id=?", (json.dumps(questions), job_id))
-            conn.commit()
+            _get_conn().execute("UPDATE jobs SET questions=? WHERE id=?", (json.dumps(questions), job_id))
+            # Saving bumps the version, so cache under the new one
+            with _questions_cache_lock:
+                _QUESTIONS_CACHE[(job_id, experience_level, jobs_version())] = tuple(questions)
             
             return jsonify({"ok": True, "questions": questions, "job_id": job_id})
         except Exception as e:
@@ -532,7 +1105,7 @@ def api_save_questions(job_id):
             if text:
                 cleaned.append(text)
         update_job_questions(job_id, cleaned)
-        print(f"✅ Saved questions for job {job_id} ({len(cleaned)} questions)")
+        logger.info("✅ Saved questions for job %s (%d questions)", job_id, len(cleaned))
         return jsonify({"ok": True, "questions": cleaned})
     except Exception as e:
         logger.exception("Save questions failed: %s", e)
@@ -560,7 +1133,8 @@ def api_upload_resume():
     Accepts multipart/form-data:
       - file (resume)
       - user_id
-    Saves file, extracts text, stores in DB.
+    Saves file and returns a resume_id immediately; text extraction runs in
+    the background (poll /api/resumes/<resume_id>/status).
     """
     try:
         if 'file' not in request.files:
@@ -572,21 +1146,47 @@ def api_upload_resume():
         filename = secure_filename(file.filename)
         saved_name = f"{uuid.uuid4()}_{filename}"
         fp = UPLOAD_DIR / saved_name
-        file.save(str(fp))
-        # extract text
-        text = extract_text_from_file(fp)
-        if not text.strip():
-            logger.warning("Extracted resume text empty for file %s", filename)
-            return jsonify({"ok": False, "error": "Could not extract text from resume. Please ensure the file is a valid PDF, DOC, or TXT file."}), 400
+        # Stream to disk in 1 MB blocks, hashing the content on the way
+        digest = hashlib.blake2b(digest_size=16)
+        with open(fp, "wb", buffering=UPLOAD_CHUNK) as out:
+            for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        content_hash = digest.hexdigest()
         
-        print(f"📄 Uploaded resume: {filename} -> Extracted {len(text)} characters")
-        rid = save_resume_to_db(user_id, saved_name, text)
-        print(f"✅ Saved resume to database: {rid} for user {user_id}")
-        return jsonify({"ok": True, "resume_id": rid, "filename": saved_name, "text_length": len(text)})
+        # Identical file uploaded before: reuse its extracted text
+        text = find_resume_text_by_hash(content_hash)
+        if text:
+            rid = save_resume_to_db(user_id, saved_name, text, content_hash=content_hash)
+            logger.info("✅ Saved resume to database: %s for user %s (duplicate upload, text reused)", rid, user_id)
+            return jsonify({"ok": True, "resume_id": rid, "filename": saved_name, "status": "ready", "text_length": len(text)})
+        
+        rid = save_resume_to_db(user_id, saved_name, None, status="processing", content_hash=content_hash)
+        EXTRACTOR.submit(_process_resume, rid, fp)
+        logger.info("✅ Saved resume to database: %s for user %s (processing)", rid, user_id)
+        return jsonify({"ok": True, "resume_id": rid, "filename": saved_name, "status": "processing"})
     except Exception as e:
         logger.exception("Upload resume failed: %s", e)
         return jsonify({"ok": False, "error": str(e)}), 500
 
+@app.get("/api/resumes/<rid>/status")
+def api_resume_status(rid):
+    cur = _get_conn().cursor()
+    cur.execute("SELECT status, length(text) FROM resumes WHERE id=?", (rid,))
+    r = cur.fetchone()
+    if not r:
+        return jsonify({"ok": False, "error": "Resume not found"}), 404
+    status = r[0] or "ready"
+    out = {"ok": True, "resume_id": rid, "status": status, "text_length": r[1] or 0}
+    if status == "failed":
+        out["error"] = "Could not extract text from resume. Please ensure the file is a valid PDF, DOC, or TXT file."
+    return jsonify(out)
+
+def _match_entry(job, pct, source):
+    """Response entry for one matched job"""
+    pct = float(pct)
+    return {"job": dict(job, similarity_pct=pct, source=source), "similarity": pct / 100.0}
+
 @app.post("/api/match")
 def api_match():
     """
@@ -603,56 +1203,40 @@ def api_match():
         preferred_location = (payload.get("preferred_location") or "").lower()
         job_type = (payload.get("job_type") or "").lower()
 
+        refresh_key = request.headers.get("X-Cache-Key", "")  # a new value forces a fresh embedding and result
+        cache_key = None
         if not resume_text and user_id:
             res = get_latest_resume(user_id)
             if not res or not res.get("text"):
                 return jsonify({"ok": False, "error": "No resume found for user. Please upload a resume first."}), 400
+            cache_key = (user_id, res["id"], jobs_version(), preferred_location, job_type, refresh_key)
+            with _match_cache_lock:
+                cached_result = MATCH_CACHE.get(cache_key)
+            if cached_result is not None:
+                return jsonify(cached_result)
             resume_text = res["text"]
-            print(f"📄 Using resume from database: {res.get('filename', 'unknown')} ({len(resume_text)} chars)")
+            logger.info("📄 Using resume from database: %s (%s chars)", res.get('filename', 'unknown'), len(resume_text))
 
         if not resume_text:
             return jsonify({"ok": False, "error": "resume_text or user_id required"}), 400
         
-        print(f"📋 Resume text length: {len(resume_text)} characters")
+        logger.info("📋 Resume text length: %s characters", len(resume_text))
 
         # Get local jobs (admin-created jobs) first
         local_jobs = list_jobs() or []
-        print(f"📋 Found {len(local_jobs)} local jobs from admin")
+        logger.info("📋 Found %s local jobs from admin", len(local_jobs))
         
         # Try to get external jobs from SerpAPI
         external_jobs = []
+        external_failed = False  # degraded results are not cached
         try:
-            import requests
             api_key = SERPAPI_KEY
             if api_key and api_key.strip():
                 # Use LLM to extract better search query from resume
-                from classifier import chat_complete
-                resume_preview = resume_text[:1500]
-                query_prompt = f"""You are a job search assistant. Analyze this resume and extract a SPECIFIC job search query.
-
-Resume:
-{resume_preview}
-
-Based on this resume, create a job search query (3-5 words) that would find the most relevant jobs.
-...
-Return ONLY the search query (3-5 words), nothing else. No explanation, no quotes, just the query.
-"""
                 try:
-                    query = chat_complete(query_prompt).strip()
-                    # Clean up: remove quotes, markdown, prefixes
-                    query = query.replace('"', '').replace("'", '').strip()
-                    if query.lower().startswith('query:'):
-                        query = query[6:].strip()
-                    if query.startswith('```'):
-                        lines = query.split('\n')
-                        query = '\n'.join(lines[1:-1]).strip()
-                    # Limit to first 50 chars and 3-5 words
-                    words = query.split()[:5]
-                    query = ' '.join(words)[:50]
-                    if not query or len(query) < 3:
-                        query = "software engineer"  # Fallback
+                    query = _extract_query(resume_text[:1500])
                 except Exception as e:
-                    print(f"⚠️ LLM query extraction failed: {e}, using fallback")
+                    logger.warning("⚠️ LLM query extraction failed: %s, using fallback", e)
                     # Fallback to simple extraction
                     resume_lower = resume_text.lower()
                     common_titles = ["engineer", "developer", "analyst", "scientist", "manager", "designer", "architect", "programmer"]
@@ -669,36 +1253,17 @@ Return ONLY the search query (3-5 words), nothing else. No explanation, no quote
                     query_parts.extend(skills[:2])
                     query = " ".join(query_parts) if query_parts else "software engineer"
                 
-                print(f"🔍 Searching external jobs with LLM-extracted query: '{query}'")
+                logger.info("🔍 Searching external jobs with LLM-extracted query: '%s'", query)
                 
-                params = {
-                    "engine": "google_jobs",
-                    "q": query,
-                    "api_key": api_key,
-                    "location": os.getenv("JOB_LOCATION", "United States"),
-                    "num": 20
-                }
-                r = requests.get("https://serpapi.com/search", params=params, timeout=30)
-                r.raise_for_status()
-                data = r.json() or {}
-                items = data.get("jobs_results", []) or []
+                items = _serpapi_search(query, os.getenv("JOB_LOCATION", "United States"))
                 
                 company_jobs = []  # Jobs from company websites
                 other_jobs = []    # Jobs from other sources
                 
                 for item in items[:20]:  # Get more jobs to prioritize company sites
                     if isinstance(item, dict) and item.get("title") and item.get("description"):
-                        # Get full description
-                        desc = item.get("description", "")
-                        # Add job highlights if available
-                        highlights = item.get("job_highlights", {})
-                        if isinstance(highlights, dict):
-                            quals = highlights.get("Qualifications", [])
-                            resp = highlights.get("Responsibilities", [])
-                            if quals:
-                                desc += "\n" + "\n".join(quals if isinstance(quals, list) else [str(quals)])
-                            if resp:
-                                desc += "\n" + "\n".join(resp if isinstance(resp, list) else [str(resp)])
+                        # Get full description, with job highlights if available
+                        desc = serpapi_description(item)
                         
                         # Check if job is from company website (via field indicates source)
                         via = item.get("via", "").lower()
@@ -722,15 +1287,18 @@ Return ONLY the search query (3-5 words), nothing else. No explanation, no quote
                 
                 # Prioritize company jobs: take up to 10 company jobs, then fill with others
                 external_jobs = company_jobs[:10] + other_jobs[:5]
-                print(f"✅ Found {len(external_jobs)} external jobs from SerpAPI ({len(company_jobs)} from company sites, {len(other_jobs)} from other sources)")
+                logger.info("✅ Found %s external jobs from SerpAPI (%s from company sites, %s from other sources)", len(external_jobs), len(company_jobs), len(other_jobs))
             else:
-                print("⚠️ SERPAPI_KEY not configured - skipping external job search")
+                logger.warning("⚠️ SERPAPI_KEY not configured - skipping external job search")
         except ImportError:
-            print("⚠️ 'requests' library not installed - cannot search external jobs")
+            external_failed = True
+            logger.warning("⚠️ 'requests' library not installed - cannot search external jobs")
         except Exception as e:
-            print(f"⚠️ External job search failed: {e}")
-            import traceback
-            traceback.print_exc()
+            external_failed = True
+            logger.warning("⚠️ External job search failed: %s", e)
+            if logger.isEnabledFor(logging.DEBUG):
+                import traceback
+                traceback.print_exc()
         
         if len(local_jobs) == 0 and len(external_jobs) == 0:
             return jsonify({
@@ -740,118 +1308,89 @@ Return ONLY the search query (3-5 words), nothing else. No explanation, no quote
             })
 
         # compute resume embedding once (using semantic embedding, not keyword matching)
-        print(f"🧠 Computing semantic embedding for resume ({len(resume_text)} chars)...")
-        print(f"   📝 This uses AI embeddings to understand meaning, not just keywords")
-        resume_emb = cached_get_embedding(resume_text)
+        logger.info("🧠 Computing semantic embedding for resume (%s chars)...", len(resume_text))
+        logger.info("   📝 This uses AI embeddings to understand meaning, not just keywords")
+        resume_emb = resume_vector(user_id, resume_text, refresh_key)
+
+        # Combine all job requirements into a comprehensive description
+        local_descs = [build_full_job_desc(j.get("description", ""), j.get("skills", []),
+                                           j.get("responsibilities", []), j.get("qualifications", []))
+                       for j in local_jobs]
+        # Location/job_type filters, compiled once and matched against the raw fields
+        loc_re = re.compile(r"\b" + re.escape(preferred_location) + r"\b", re.IGNORECASE) if preferred_location else None
+        jt_re = re.compile(r"\b" + re.escape(job_type) + r"\b", re.IGNORECASE) if job_type else None
+        # Filter external jobs by location/job_type if provided
+        candidate_external = []
+        for j in external_jobs:
+            loc = j.get("location") if isinstance(j.get("location"), str) else ""
+            if loc_re and not loc_re.search(loc):
+                continue
+            if jt_re and not (jt_re.search(j.get("title", "")) or jt_re.search(j.get("description", ""))):
+                continue
+            candidate_external.append(j)
+
+        # One pool (local jobs with a description, then external candidates) scored once;
+        # every list below is an index slice of these arrays
+        pool_jobs, pool_descs = [], []
+        for j, full_job_desc in zip(local_jobs, local_descs):
+            if full_job_desc.strip():
+                pool_jobs.append(j)
+                pool_descs.append(full_job_desc)
+            else:
+                logger.debug("  ⚠️ Skipping local job '%s' - no description", j.get('title', 'Unknown'))
+        n_local = len(pool_jobs)
+        pool_jobs += candidate_external
+        pool_descs += [j.get("description", "") for j in candidate_external]
+        sims = compute_matches(resume_emb, pool_jobs, pool_descs)
+        pct = np.round(sims.astype(np.float64) * 100, 2)
 
         # PHASE 1: Match local jobs (admin-created jobs) first
-        local_matches = []
+        local_idx = np.arange(n_local)
         if local_jobs:
-            print(f"🔍 Phase 1: Matching {len(local_jobs)} local jobs against resume requirements...")
-            for j in local_jobs:
-                # Build comprehensive job description from all fields
-                job_desc = j.get("description", "") or ""
-                skills = j.get("skills", [])
-                responsibilities = j.get("responsibilities", [])
-                qualifications = j.get("qualifications", [])
-                
-                # Combine all job requirements into a comprehensive description
-                full_job_desc = job_desc
-                if skills and isinstance(skills, list) and len(skills) > 0:
-                    full_job_desc += "\n\nRequired Skills: " + ", ".join(skills)
-                if responsibilities and isinstance(responsibilities, list) and len(responsibilities) > 0:
-                    full_job_desc += "\n\nResponsibilities:\n" + "\n".join(responsibilities)
-                if qualifications and isinstance(qualifications, list) and len(qualifications) > 0:
-                    full_job_desc += "\n\nQualifications:\n" + "\n".join(qualifications)
-                
-                # Skip if job description is empty
-                if not full_job_desc.strip():
-                    print(f"  ⚠️ Skipping local job '{j.get('title', 'Unknown')}' - no description")
-                    continue
-                
-                # Compute similarity
-                try:
-                    job_emb = cached_get_embedding(full_job_desc)
-                    sim_val = cosine_similarities(resume_emb, job_emb)
-                    if isinstance(sim_val, (list, tuple, np.ndarray)):
-                        try:
-                            sim = float(sim_val[0])
-                        except Exception:
-                            sim = float(sim_val)
-                    else:
-                        sim = float(sim_val)
-                    pct = round(sim * 100, 2)
-                except Exception as e:
-                    print(f"  ⚠️ Error computing similarity for local job '{j.get('title', 'Unknown')}': {e}")
-                    continue
-                
-                # For local jobs, be more lenient with location/job_type filters
-                # Only filter if location is explicitly set AND doesn't match
-                loc = (j.get("location") or "").lower() if isinstance(j.get("location"), str) else ""
-                title_desc = (j.get("title", "") + " " + full_job_desc).lower()
-                
-                # Skip only if location filter is provided AND job has location AND it doesn't match
-                if preferred_location and loc and preferred_location not in loc:
-                    print(f"  ⚠️ Local job '{j.get('title', 'Unknown')}' filtered by location: '{loc}' doesn't match '{preferred_location}'")
-                    continue
-                
-                # Skip only if job_type filter is provided AND it doesn't match (be more lenient)
-                if job_type and job_type != 'any' and job_type not in title_desc:
-                    print(f"  ⚠️ Local job '{j.get('title', 'Unknown')}' filtered by job type: '{job_type}' not in description")
+            logger.info("🔍 Phase 1: Matching %s local jobs against resume requirements...", len(local_jobs))
+            # For local jobs, be more lenient with location/job_type filters:
+            # skip only if the job has a location that doesn't match, or the job type is in neither title nor description
+            passes = np.ones(n_local, dtype=bool)
+            for i in range(n_local):
+                j = pool_jobs[i]
+                loc = j.get("location") if isinstance(j.get("location"), str) else ""
+                if loc_re and loc and not loc_re.search(loc):
+                    logger.debug("  ⚠️ Local job '%s' filtered by location: '%s' doesn't match '%s'", j.get('title', 'Unknown'), loc, preferred_location)
+                    passes[i] = False
+                elif jt_re and job_type != 'any' and not (jt_re.search(j.get("title", "")) or jt_re.search(pool_descs[i])):
+                    logger.debug("  ⚠️ Local job '%s' filtered by job type: '%s' not in description", j.get('title', 'Unknown'), job_type)
+                    passes[i] = False
+            local_idx = local_idx[passes]
+            logger.info("✅ Phase 1 complete: Found %s matching local jobs (out of %s total)", len(local_idx), len(local_jobs))
+
+            # Backfill stored embeddings for jobs created before they were precomputed. "fresh" also
+            # covers every job when the resume vector is unusable, so go by the stored rows instead.
+            job_rows, _ = job_embeddings()
+            backfill = []
+            for j in pool_jobs[:n_local]:
+                if j.get("id") in job_rows:
                     continue
-                
-                j_copy = j.copy()
-                j_copy["similarity_pct"] = pct
-                j_copy["source"] = "local"  # Mark as local job
-                local_matches.append({"job": j_copy, "similarity": pct / 100.0})
-                print(f"  ✓ Local job '{j.get('title', 'Unknown')}': {pct}% match")
-            
-            print(f"✅ Phase 1 complete: Found {len(local_matches)} matching local jobs (out of {len(local_jobs)} total)")
+                emb = compute_job_embedding(j.get("description", ""), j.get("skills", []),
+                                            j.get("responsibilities", []), j.get("qualifications", []))
+                if emb is not None:  # embedding outage: leave it for a later match
+                    backfill.append((j["id"], emb))
+            if backfill:
+                with tx():
+                    for job_id, emb in backfill:
+                        store_job_embedding(job_id, emb)
+                refresh_job_embeddings()
 
         # PHASE 2: Match external jobs
-        external_matches = []
+        ext_idx = np.arange(n_local, len(pool_jobs))
         if external_jobs:
-            print(f"🔍 Phase 2: Matching {len(external_jobs)} external jobs...")
-            # Filter external jobs by location/job_type if provided
-            candidate_external = []
-            for j in external_jobs:
-                loc = (j.get("location") or "").lower() if isinstance(j.get("location"), str) else ""
-                title_desc = (j.get("title", "") + " " + j.get("description", "")).lower()
-                if preferred_location and preferred_location not in loc:
-                    continue
-                if job_type and job_type not in title_desc:
-                    continue
-                candidate_external.append(j)
-            
-            print(f"🔍 Computing similarity scores for {len(candidate_external)} external jobs...")
-            for j in candidate_external:
-                desc = j.get("description", "")
-                job_emb = cached_get_embedding(desc)
-                sim_val = cosine_similarities(resume_emb, job_emb)
-                if isinstance(sim_val, (list, tuple, np.ndarray)):
-                    try:
-                        sim = float(sim_val[0])
-                    except Exception:
-                        sim = float(sim_val)
-                else:
-                    sim = float(sim_val)
-                pct = round(sim * 100, 2)
-                j_copy = j.copy()
-                j_copy["similarity_pct"] = pct
-                j_copy["source"] = "external"  # Mark as external job
-                external_matches.append({"job": j_copy, "similarity": pct / 100.0})
-            
-            print(f"✅ Phase 2 complete: Found {len(external_matches)} matching external jobs")
-
-        # Combine matches: local jobs first, then external jobs
-        matches = local_matches + external_matches
-        print(f"📊 Total matches: {len(matches)} (local: {len(local_matches)}, external: {len(external_matches)})")
-
-        # Sort: local jobs by similarity (descending), then external jobs by similarity (descending)
-        # Since we already have local_matches first, we just need to sort each group
-        local_matches = sorted(local_matches, key=lambda x: -x["similarity"])
-        external_matches = sorted(external_matches, key=lambda x: -x["similarity"])
-        matches = local_matches + external_matches  # Local jobs first, then external
+            logger.info("🔍 Phase 2: Matching %s external jobs...", len(external_jobs))
+            logger.info("✅ Phase 2 complete: Found %s matching external jobs", len(ext_idx))
+
+        # Sort each group by similarity (descending); local jobs come first, then external jobs
+        local_idx = local_idx[np.argsort(-pct[local_idx], kind="stable")]
+        ext_idx = ext_idx[np.argsort(-pct[ext_idx], kind="stable")]
+        order = np.concatenate((local_idx, ext_idx))
+        logger.info("📊 Total matches: %s (local: %s, external: %s)", len(order), len(local_idx), len(ext_idx))
         
         # apply threshold if provided in env
         threshold_env = float(os.getenv("MATCH_THRESHOLD", "50"))  # Default to 50%
@@ -862,76 +1401,112 @@ Return ONLY the search query (3-5 words), nothing else. No explanation, no quote
         # ensure reasonable minimum (at least 40% - allow some flexibility)
         threshold_pct = max(threshold_pct, 40.0)
         
-        print(f"🔒 Using similarity threshold: {threshold_pct}%")
-        print(f"📈 Found {len(matches)} total matches before filtering")
+        logger.info("🔒 Using similarity threshold: %s%%", threshold_pct)
+        logger.info("📈 Found %s total matches before filtering", len(order))
         
         # Log all matches for debugging
-        print(f"\n📊 Match Results Summary:")
-        if local_matches:
-            print(f"  Local Jobs (Admin-created):")
-            for m in local_matches[:3]:  # Show top 3 local
-                sim_pct = m["similarity"] * 100
-                job_title = m["job"].get("title", "Unknown")
-                print(f"    [{sim_pct:.1f}%] '{job_title}' - {'✓ PASS' if sim_pct >= threshold_pct else '✗ FILTERED OUT'}")
-        if external_matches:
-            print(f"  External Jobs (SerpAPI):")
-            for m in external_matches[:3]:  # Show top 3 external
-                sim_pct = m["similarity"] * 100
-                job_title = m["job"].get("title", "Unknown")
-                print(f"    [{sim_pct:.1f}%] '{job_title}' - {'✓ PASS' if sim_pct >= threshold_pct else '✗ FILTERED OUT'}")
-        
-        filtered = [m for m in matches if m["similarity"] * 100 >= threshold_pct]
+        logger.debug("📊 Match Results Summary:")
+        if len(local_idx):
+            logger.debug("  Local Jobs (Admin-created):")
+            for i in local_idx[:3]:  # Show top 3 local
+                logger.debug("    [%.1f%%] '%s' - %s", pct[i], pool_jobs[i].get("title", "Unknown"), '✓ PASS' if pct[i] >= threshold_pct else '✗ FILTERED OUT')
+        if len(ext_idx):
+            logger.debug("  External Jobs (SerpAPI):")
+            for i in ext_idx[:3]:  # Show top 3 external
+                logger.debug("    [%.1f%%] '%s' - %s", pct[i], pool_jobs[i].get("title", "Unknown"), '✓ PASS' if pct[i] >= threshold_pct else '✗ FILTERED OUT')
         
-        # Log detailed breakdown
-        filtered_local_count = len([m for m in filtered if m["job"].get("source") == "local"])
-        filtered_external_count = len([m for m in filtered if m["job"].get("source") == "external"])
+        filtered_local_idx = local_idx[pct[local_idx] >= threshold_pct]
+        filtered_ext_idx = ext_idx[pct[ext_idx] >= threshold_pct]
         
-        print(f"✅ Returning {len(filtered)} matches above {threshold_pct}% threshold")
-        print(f"   - Local jobs: {filtered_local_count}/{len(local_matches)} passed threshold")
-        print(f"   - External jobs: {filtered_external_count}/{len(external_matches)} passed threshold")
+        logger.info("✅ Returning %s matches above %s%% threshold", len(filtered_local_idx) + len(filtered_ext_idx), threshold_pct)
+        logger.info("   - Local jobs: %s/%s passed threshold", len(filtered_local_idx), len(local_idx))
+        logger.info("   - External jobs: %s/%s passed threshold", len(filtered_ext_idx), len(ext_idx))
         
         # If local jobs exist but none passed threshold, show them anyway if they're above 30%
         # This ensures admin-created jobs are always visible if they exist
-        if len(local_matches) > 0 and filtered_local_count == 0:
-            print(f"⚠️ No local jobs passed {threshold_pct}% threshold. Showing local jobs above 30%...")
-            local_above_30 = [m for m in local_matches if m["similarity"] * 100 >= 30.0]
-            if local_above_30:
-                print(f"   Found {len(local_above_30)} local jobs above 30% threshold - adding to results")
-                # Add local jobs above 30% to filtered results (prioritize them)
-                filtered = local_above_30 + [m for m in filtered if m["job"].get("source") != "local"]
+        if len(local_idx) > 0 and len(filtered_local_idx) == 0:
+            logger.warning("⚠️ No local jobs passed %s%% threshold. Showing local jobs above 30%%...", threshold_pct)
+            filtered_local_idx = local_idx[pct[local_idx] >= 30.0]
+            if len(filtered_local_idx):
+                logger.info("   Found %s local jobs above 30%% threshold - adding to results", len(filtered_local_idx))
+        
+        # Job dicts are only copied for the matches that are returned
+        filtered_local = [_match_entry(pool_jobs[i], pct[i], "local") for i in filtered_local_idx]
+        filtered_external = [_match_entry(pool_jobs[i], pct[i], "external") for i in filtered_ext_idx]
+        filtered = filtered_local + filtered_external
         
         # Provide helpful message if no matches
         message = None
         if not filtered:
-            if len(matches) > 0:
-                top_match = matches[0]
-                top_sim = top_match["similarity"] * 100
-                message = f"Found {len(matches)} jobs, but none meet the {threshold_pct}% similarity threshold. Highest match: {top_sim:.1f}%. Try: 1) Uploading a more detailed resume, 2) Adding more relevant skills/experience, or 3) Lowering the threshold temporarily."
-            elif len(local_matches) == 0 and len(external_matches) == 0:
-                if len(local_jobs) == 0 and len(external_jobs) == 0:
-                    message = "No jobs found. Check if SERPAPI_KEY is configured and there are local jobs in the database."
-                else:
-                    message = "No jobs found matching your location/job type filters. Try adjusting your search criteria."
+            if len(order) > 0:
+                top_sim = pct[order[0]]
+                message = f"Found {len(order)} jobs, but none meet the {threshold_pct}% similarity threshold. Highest match: {top_sim:.1f}%. Try: 1) Uploading a more detailed resume, 2) Adding more relevant skills/experience, or 3) Lowering the threshold temporarily."
+            elif len(local_jobs) == 0 and len(external_jobs) == 0:
+                message = "No jobs found. Check if SERPAPI_KEY is configured and there are local jobs in the database."
             else:
-                message = f"No jobs found with {threshold_pct}% or higher similarity. Try refining your resume or search criteria."
+                message = "No jobs found matching your location/job type filters. Try adjusting your search criteria."
         
-        # Separate filtered matches back into local and external for frontend display
-        filtered_local = [m for m in filtered if m["job"].get("source") == "local"]
-        filtered_external = [m for m in filtered if m["job"].get("source") == "external"]
-        
-        return jsonify({
+        result = {
             "ok": True, 
             "matches": filtered,  # Combined list (local first, then external)
             "local_matches": filtered_local,  # Local matches only
             "external_matches": filtered_external,  # External matches only
             "threshold_pct": threshold_pct,
             "message": message
-        })
+        }
+        # A zero resume vector (embedding outage) or a failed SerpAPI call would pin degraded results for the TTL
+        if cache_key is not None and resume_emb.any() and not external_failed:
+            with _match_cache_lock:
+                MATCH_CACHE[cache_key] = result
+        return jsonify(result)
     except Exception as e:
         logger.exception("Match failed: %s", e)
-        print(f"Error: {e}")
         return jsonify({"ok": False, "error": str(e)}), 500
 
+_SCORE_RE = re.compile(rb'\{[^{}]*?"score"\s*:\s*\d+[^{}]*?\}', re.S)
+
+def _score_one(r, resume_text, rerank=True):
+    """Result entry for one retrieved job, with the LLM's score and explanation when reranking"""
+    job = r["job"]
+    match_pct = r["match_pct"]
+    job_desc = job.get("full_description", job.get("description", ""))
+
+    result_entry = {
+        "job": job,
+        "similarity": r["score"],
+        "match_score": match_pct,
+        "match_explanation": ""
+    }
+
+    # LLM re-ranking and explanation for better RAG results
+    if rerank:
+        prompt = (
+            f"Analyze how well this resume matches the job description. "
+            f"Provide a detailed explanation of the match, highlighting:\n"
+            f"1. Key skills that match\n"
+            f"2. Experience alignment\n"
+            f"3. Any gaps or areas for improvement\n\n"
+            f"Resume (first 2000 chars):\n{resume_text[:2000]}\n\n"
+            f"Job Description:\n{job_desc[:2000]}\n\n"
+            f"Return a JSON object with: {{\"score\": <0-100>, \"explanation\": \"<detailed explanation>\"}}"
+        )
+        try:
+            llm_out = chat_complete(prompt)
+            # Localize the {"score": ...} object in one regex pass and parse it with orjson
+            m = _SCORE_RE.search(llm_out.encode("utf-8"))
+            if m:
+                parsed = _json_loads(m.group(0))
+                if isinstance(parsed, dict):
+                    if parsed.get("score") is not None:
+                        result_entry["llm_score"] = int(parsed.get("score"))
+                    result_entry["match_explanation"] = parsed.get("explanation", "")
+            else:
+                result_entry["match_explanation"] = llm_out
+        except Exception as e:
+            result_entry["match_explanation"] = f"Analysis unavailable: {str(e)}"
+
+    return result_entry
+
 # New endpoint: /api/rag-search
 @app.post("/api/rag-search")
 def api_rag_search():
@@ -956,7 +1531,7 @@ def api_rag_search():
             if not res or not res.get("text"):
                 return jsonify({"ok": False, "error": "No resume found for user. Please upload a resume first."}), 400
             resume_text = res["text"]
-            print(f"📄 Using resume from database: {res.get('filename', 'unknown')} ({len(resume_text)} chars)")
+            logger.info("📄 Using resume from database: %s (%s chars)", res.get('filename', 'unknown'), len(resume_text))
 
         if not resume_text:
             return jsonify({"ok": False, "error": "resume_text or user_id required"}), 400
@@ -964,9 +1539,9 @@ def api_rag_search():
         # Log resume summary for debugging
         resume_preview_words = resume_text[:500].split()[:20]
         resume_preview = ' '.join(resume_preview_words)
-        print(f"🔍 RAG Search: Processing resume ({len(resume_text)} chars)")
-        print(f"   Resume preview: {resume_preview}...")
-        print(f"   Requested top_k: {top_k}")
+        logger.info("🔍 RAG Search: Processing resume (%s chars)", len(resume_text))
+        logger.info("   Resume preview: %s...", resume_preview)
+        logger.info("   Requested top_k: %s", top_k)
 
         # Get all jobs (local + external)
         local_jobs = list_jobs() or []
@@ -974,87 +1549,35 @@ def api_rag_search():
         # Try to get external jobs
         external_jobs = []
         try:
-            import requests
             api_key = SERPAPI_KEY
             if api_key and api_key.strip():
-                from classifier import chat_complete
-                # Extract key terms from resume for better query generation
-                resume_preview = resume_text[:2000]  # Use more context
-                
-                query_prompt = f"""You are a job search assistant. Analyze this resume and extract a SPECIFIC job search query.
-
-Resume:
-{resume_preview}
-
-Based on this resume, create a job search query (3-5 words) that would find the most relevant jobs.
-Focus on:
-1. Job title/role mentioned or implied
-2. Primary technology/skill/domain
-3. Experience level if apparent
-
-Examples:
-- "Software Engineer Python" for Python developers
-- "Data Scientist Machine Learning" for ML data scientists
-- "Product Manager SaaS" for product managers in SaaS
-- "Marketing Manager Digital" for digital marketing managers
-
-IMPORTANT: Make it SPECIFIC to this resume. If resume mentions "React developer", use "React Developer" not generic "software engineer".
-If resume mentions "Data Analyst SQL", use "Data Analyst SQL" not just "Data Analyst".
-
-Return ONLY the search query (3-5 words), nothing else. No explanation, no quotes, just the query.
-"""
-                try:
-                    query = chat_complete(query_prompt).strip()
-                    # Clean up the query
-                    query = query.replace('"', '').replace("'", '').strip()
-                    # Remove common prefixes
-                    for prefix in ["Query:", "Search:", "Jobs:", "The query is:", "Query is:"]:
-                        if query.lower().startswith(prefix.lower()):
-                            query = query[len(prefix):].strip()
-                    
-                    # Extract first 5 meaningful words
-                    words = [w for w in query.split() if len(w) > 2][:5]
-                    query = ' '.join(words)[:50]
-                    
-                    # Fallback: Try to extract from resume directly
-                    if not query or len(query) < 3:
-                        query = "software engineer"
-                        # Extract key skills/technologies from resume
-                        resume_lower = resume_text.lower()
-                        common_titles = ["engineer", "developer", "analyst", "scientist", "manager", "designer", "architect", "consultant", "specialist"]
-                        common_skills = ["python", "java", "react", "javascript", "sql", "data", "machine learning", "ai", "cloud", "aws"]
-                        
-                        found_title = None
-                        for title in common_titles:
-                            if title in resume_lower:
-                                found_title = title
-                                break
+                # A clear (title, skill) pair in the resume is enough; only ask the LLM otherwise
+                query = extract_query_fast(resume_text)
+                if query:
+                    logger.info("🔍 Keyword search query for resume: '%s' (resume length: %s chars)", query, len(resume_text))
+                else:
+                    # Extract key terms from resume for better query generation
+                    resume_preview = resume_text[:2000]  # Use more context
+                    try:
+                        query = _resume_to_query(resume_preview)
                         
-                        found_skill = None
-                        for skill in common_skills:
-                            if skill in resume_lower:
-                                found_skill = skill
-                                break
+                        # Fallback: Try to extract from resume directly
+                        if not query or len(query) < 3:
+                            title = _TITLE_RE.search(resume_text)
+                            query = title.group(1).title() if title else "software engineer"
                         
-                        if found_title and found_skill:
-                            query = f"{found_title.title()} {found_skill.title()}"
-                        elif found_title:
-                            query = found_title.title()
+                        logger.info("🔍 Generated search query for resume: '%s' (resume length: %s chars)", query, len(resume_text))
+                    except Exception as e:
+                        logger.warning("⚠️ Query extraction failed: %s", e)
+                        # Fallback: Try keyword extraction
+                        resume_lower = resume_text.lower()
+                        if "data" in resume_lower and "scientist" in resume_lower:
+                            query = "Data Scientist"
+                        elif "engineer" in resume_lower or "developer" in resume_lower:
+                            query = "Software Engineer"
                         else:
                             query = "software engineer"
-                    
-                    print(f"🔍 Generated search query for resume: '{query}' (resume length: {len(resume_text)} chars)")
-                except Exception as e:
-                    print(f"⚠️ Query extraction failed: {e}")
-                    # Fallback: Try keyword extraction
-                    resume_lower = resume_text.lower()
-                    if "data" in resume_lower and "scientist" in resume_lower:
-                        query = "Data Scientist"
-                    elif "engineer" in resume_lower or "developer" in resume_lower:
-                        query = "Software Engineer"
-                    else:
-                        query = "software engineer"
-                    print(f"🔍 Using fallback query: '{query}'")
+                        logger.info("🔍 Using fallback query: '%s'", query)
                 
                 params = {
                     "engine": "google_jobs",
@@ -1063,21 +1586,13 @@ Return ONLY the search query (3-5 words), nothing else. No explanation, no quote
                     "location": os.getenv("JOB_LOCATION", "United States"),
                     "num": 20
                 }
-                r = requests.get("https://serpapi.com/search", params=params, timeout=30)
+                r = SERPAPI_SESSION.get(SERPAPI_URL, params=params, timeout=30)
                 if r.status_code == 200:
                     data = r.json() or {}
                     items = data.get("jobs_results", []) or []
                     for item in items[:15]:
                         if isinstance(item, dict) and item.get("title") and item.get("description"):
-                            desc = item.get("description", "")
-                            highlights = item.get("job_highlights", {})
-                            if isinstance(highlights, dict):
-                                quals = highlights.get("Qualifications", [])
-                                resp = highlights.get("Responsibilities", [])
-                                if quals:
-                                    desc += "\n" + "\n".join(quals if isinstance(quals, list) else [str(quals)])
-                                if resp:
-                                    desc += "\n" + "\n".join(resp if isinstance(resp, list) else [str(resp)])
+                            desc = serpapi_description(item)
                             
                             external_jobs.append({
                                 "id": f"ext_{item.get('job_id', str(uuid.uuid4()))}",
@@ -1089,82 +1604,81 @@ Return ONLY the search query (3-5 words), nothing else. No explanation, no quote
                                 "source": "external"
                             })
         except Exception as e:
-            print(f"⚠️ External job search failed: {e}")
+            logger.warning("⚠️ External job search failed: %s", e)
 
-        # Combine all jobs
-        all_jobs = []
+        # Combine all jobs into a struct-of-arrays pool (row i of each list is job i);
+        # job dicts are only copied for the top-k that end up in the response
+        pool_jobs, pool_descs, pool_src = [], [], []
         for j in local_jobs:
-            job_desc = j.get("description", "") or ""
-            skills = j.get("skills", [])
-            responsibilities = j.get("responsibilities", [])
-            qualifications = j.get("qualifications", [])
-            
-            full_job_desc = job_desc
-            if skills and isinstance(skills, list) and len(skills) > 0:
-                full_job_desc += "\n\nRequired Skills: " + ", ".join(skills)
-            if responsibilities and isinstance(responsibilities, list) and len(responsibilities) > 0:
-                full_job_desc += "\n\nResponsibilities:\n" + "\n".join(responsibilities)
-            if qualifications and isinstance(qualifications, list) and len(qualifications) > 0:
-                full_job_desc += "\n\nQualifications:\n" + "\n".join(qualifications)
+            full_job_desc = build_full_job_desc(j.get("description", ""), j.get("skills", []),
+                                                j.get("responsibilities", []), j.get("qualifications", []))
             
             if full_job_desc.strip():
-                j_copy = j.copy()
-                j_copy["full_description"] = full_job_desc
-                j_copy["source"] = "local"
-                all_jobs.append(j_copy)
+                pool_jobs.append(j)
+                pool_descs.append(full_job_desc)
+                pool_src.append("local")
         
         for j in external_jobs:
-            j_copy = j.copy()
-            j_copy["full_description"] = j.get("description", "")
-            all_jobs.append(j_copy)
+            pool_jobs.append(j)
+            pool_descs.append(j.get("description", ""))
+            pool_src.append(j.get("source", "external"))
 
-        if not all_jobs:
+        if not pool_jobs:
             return jsonify({"ok": True, "results": [], "message": "No jobs available for matching"})
 
-        print(f"📋 Job pool: {len(local_jobs)} local jobs, {len(external_jobs)} external jobs = {len(all_jobs)} total")
+        logger.info("📋 Job pool: %s local jobs, %s external jobs = %s total", len(local_jobs), len(external_jobs), len(pool_jobs))
         if external_jobs:
-            print(f"   External job titles: {[j.get('title', 'N/A')[:30] for j in external_jobs[:5]]}")
-
-        # Build job descriptions list for vector search
-        job_descriptions = [j.get("full_description", j.get("description", "")) for j in all_jobs]
-        
-        # Use vector store for RAG retrieval
-        resume_emb = cached_get_embedding(resume_text)
-        job_embeddings = [cached_get_embedding(desc) for desc in job_descriptions]
-        job_embeddings_array = np.array(job_embeddings)
-        
-        # Search using cosine similarity
-        from sklearn.metrics.pairwise import cosine_similarity
-        sims = cosine_similarity([resume_emb], job_embeddings_array)[0]
+            logger.info("   External job titles: %s", [j.get('title', 'N/A')[:30] for j in external_jobs[:5]])
+
+        # Use vector store for RAG retrieval (a new X-Cache-Key value re-embeds the resume)
+        resume_emb = resume_vector(user_id, resume_text, request.headers.get("X-Cache-Key", ""))
+        # Stored local jobs are pruned by the ANN index: only their top_k nearest stay in the pool
+        # (external jobs and jobs not yet indexed always stay)
+        ann = nearest_jobs(resume_emb, top_k)
+        if ann is not None:
+            indexed, nearest = ann
+            keep = [i for i, j in enumerate(pool_jobs)
+                    if pool_src[i] != "local" or j.get("id") not in indexed or j.get("id") in nearest]
+            pool_jobs = [pool_jobs[i] for i in keep]
+            pool_descs = [pool_descs[i] for i in keep]
+            pool_src = [pool_src[i] for i in keep]
+        sims = compute_matches(resume_emb, pool_jobs, pool_descs)
+        # How generic the resume is: its mean similarity to every stored job, one dot with the centroid
+        with _job_emb_lock:
+            corpus_mean = JOB_MEAN
+        corpus_similarity = avg_cosine_to_corpus(resume_emb, corpus_mean)
+        logger.info("   Mean similarity to the local job corpus: %.1f%%", corpus_similarity * 100)
         
         # Apply minimum similarity threshold to ensure quality matches
         min_similarity = float(os.getenv("RAG_MIN_SIMILARITY", "0.3"))  # 30% minimum
-        print(f"📊 Computing similarities for {len(all_jobs)} jobs (min threshold: {min_similarity*100:.1f}%)")
+        logger.info("📊 Computing similarities for %s jobs (min threshold: %.1f%%)", len(pool_jobs), min_similarity*100)
         
         # Filter by minimum similarity and get top-k
-        valid_indices = [i for i, sim in enumerate(sims) if sim >= min_similarity]
-        if not valid_indices:
-            print(f"⚠️ No jobs above {min_similarity*100:.1f}% similarity threshold")
+        valid_indices = np.flatnonzero(sims >= min_similarity)
+        if not len(valid_indices):
+            logger.warning("⚠️ No jobs above %.1f%% similarity threshold", min_similarity*100)
             # Relax threshold slightly if no matches
             min_similarity = 0.2
-            valid_indices = [i for i, sim in enumerate(sims) if sim >= min_similarity]
+            valid_indices = np.flatnonzero(sims >= min_similarity)
         
-        # Get top-k from valid indices, sorted by similarity
-        valid_sims = [(i, sims[i]) for i in valid_indices]
-        valid_sims.sort(key=lambda x: x[1], reverse=True)
-        top_indices = [i for i, _ in valid_sims[:top_k]]
+        # Get top-k from valid indices: partition to find the k-th best score, then sort only
+        # what reaches it (ties keep job order, as the previous stable sort did)
+        if 0 < top_k < len(valid_indices):
+            kth = -np.partition(-sims[valid_indices], top_k - 1)[top_k - 1]
+            valid_indices = valid_indices[sims[valid_indices] >= kth]
+        top_indices = valid_indices[np.lexsort((valid_indices, -sims[valid_indices]))][:top_k].tolist()
         
         if top_indices:
-            print(f"✅ Found {len(top_indices)} jobs above threshold (top similarity: {sims[top_indices[0]]*100:.1f}%)")
+            logger.info("✅ Found %s jobs above threshold (top similarity: %.1f%%)", len(top_indices), sims[top_indices[0]]*100)
             # Log some similarity scores for debugging
-            print(f"   Top 3 similarities: {[f'{sims[i]*100:.1f}%' for i in top_indices[:3]]}")
+            logger.info("   Top 3 similarities: %s", [f'{sims[i]*100:.1f}%' for i in top_indices[:3]])
         else:
-            print(f"⚠️ No jobs found above threshold after filtering")
+            logger.warning("⚠️ No jobs found above threshold after filtering")
         
         # Build initial results
         raw_results = []
         for idx in top_indices:
-            job = all_jobs[idx]
+            job = dict(pool_jobs[idx], full_description=pool_descs[idx], source=pool_src[idx])
             score = float(sims[idx])
             match_pct = round(score * 100, 2)
             raw_results.append({
@@ -1173,51 +1687,14 @@ Return ONLY the search query (3-5 words), nothing else. No explanation, no quote
                 "match_pct": match_pct
             })
 
-        # RAG: Use LLM to enhance results with explanations
-        results = []
-        for r in raw_results:
-            job = r["job"]
-            match_pct = r["match_pct"]
-            job_desc = job.get("full_description", job.get("description", ""))
-
-            result_entry = {
-                "job": job,
-                "similarity": r["score"],
-                "match_score": match_pct,
-                "match_explanation": ""
-            }
-
-            # LLM re-ranking and explanation for better RAG results
-            if rerank:
-                prompt = (
-                    f"Analyze how well this resume matches the job description. "
-                    f"Provide a detailed explanation of the match, highlighting:\n"
-                    f"1. Key skills that match\n"
-                    f"2. Experience alignment\n"
-                    f"3. Any gaps or areas for improvement\n\n"
-                    f"Resume (first 2000 chars):\n{resume_text[:2000]}\n\n"
-                    f"Job Description:\n{job_desc[:2000]}\n\n"
-                    f"Return a JSON object with: {{\"score\": <0-100>, \"explanation\": \"<detailed explanation>\"}}"
-                )
-                try:
-                    llm_out = chat_complete(prompt)
-                    import json as _json
-                    # Try to extract JSON from response
-                    if "{" in llm_out and "}" in llm_out:
-                        start = llm_out.find("{")
-                        end = llm_out.rfind("}") + 1
-                        json_str = llm_out[start:end]
-                        parsed = _json.loads(json_str)
-                        if isinstance(parsed, dict):
-                            if parsed.get("score") is not None:
-                                result_entry["llm_score"] = int(parsed.get("score"))
-                            result_entry["match_explanation"] = parsed.get("explanation", "")
-                    else:
-                        result_entry["match_explanation"] = llm_out
-                except Exception as e:
-                    result_entry["match_explanation"] = f"Analysis unavailable: {str(e)}"
-
-            results.append(result_entry)
+        # RAG: Use LLM to enhance results with explanations (independent calls, run concurrently)
+        if rerank and raw_results:
+            results = [None] * len(raw_results)
+            futs = {_POOL.submit(_score_one, r, resume_text): i for i, r in enumerate(raw_results)}
+            for f in as_completed(futs):
+                results[futs[f]] = f.result()
+        else:
+            results = [_score_one(r, resume_text, rerank=False) for r in raw_results]
 
         # Sort by LLM score if available, otherwise by similarity
         if rerank and any("llm_score" in r for r in results):
@@ -1243,19 +1720,112 @@ Return ONLY the search query (3-5 words), nothing else. No explanation, no quote
         if formatted_results:
             try:
                 top_preview = [f"{item['job'].get('title', 'N/A')} ({item['similarity']*100:.1f}%)" for item in formatted_results[:3]]
-                print(f"🔎 Returning {len(formatted_results)} matches | Preview: {top_preview}")
+                logger.info("🔎 Returning %s matches | Preview: %s", len(formatted_results), top_preview)
             except Exception as log_err:
-                print(f"⚠️ Failed to log match preview: {log_err}")
+                logger.warning("⚠️ Failed to log match preview: %s", log_err)
         else:
-            print("🔎 No matches to return after formatting")
+            logger.info("🔎 No matches to return after formatting")
 
-        return jsonify({"ok": True, "results": formatted_results, "matches": formatted_results})
+        return jsonify({"ok": True, "results": formatted_results, "matches": formatted_results,
+                        "corpus_similarity": round(corpus_similarity, 4)})
     except Exception as e:
-        import traceback
-        traceback.print_exc()
         logger.exception("RAG search failed: %s", e)
         return jsonify({"ok": False, "error": str(e)}), 500
 
+VALIDATE_RETRIES = 3
+# Answers validated per LLM call (the job description is sent once per batch)
+VALIDATE_BATCH_SIZE = int(os.getenv("VALIDATE_BATCH_SIZE", "16"))
+
+def _validate_answer(job_desc, qtxt, ans):
+    """LLM validation of one answer, retried with backoff while no model is reachable"""
+    validate_prompt = f"Job description: {job_desc}\nQuestion: {qtxt}\nAnswer: {ans}\nAssess relevance from 0-100 and say if likely copied or original. Return JSON like {{'score':int,'originality':'original'|'copied','feedback':'...'}}"
+    for attempt in range(VALIDATE_RETRIES):
+        out = chat_complete(validate_prompt)
+        if out != CHAT_UNAVAILABLE or attempt == VALIDATE_RETRIES - 1:
+            break
+        time.sleep((2 ** attempt) * 0.5)
+    try:
+        return json.loads(out)
+    except Exception:
+        return {"score": 70, "originality": "original", "feedback": out[:200]}
+
+def _validate_batch(job_desc, qa):
+    """Validations for a batch of (key, question, answer) in one LLM call, or None if the reply isn't usable"""
+    items = "\n".join(f"{n}. Q: {qtxt} A: {ans}" for n, (_, qtxt, ans) in enumerate(qa, 1))
+    prompt = (f"Job description: {job_desc}\n"
+              "Validate each Q/A below: rate relevance from 0-100 and say if the answer is likely copied or original. "
+              "Return only a JSON array with one object per question, in order, like "
+              "[{\"score\":int,\"originality\":\"original\"|\"copied\",\"feedback\":\"...\"}]:\n"
+              f"{items}")
+    out = chat_complete(prompt)
+    start, end = out.find("["), out.rfind("]")
+    try:
+        parsed = _json_loads(out[start:end + 1]) if 0 <= start < end else None
+    except ValueError:
+        return None
+    if not isinstance(parsed, list) or len(parsed) != len(qa) or not all(isinstance(v, dict) for v in parsed):
+        return None
+    return parsed
+
+def _sse(data, event=None):
+    """One Server-Sent Events message (multi-line data becomes several data: lines)"""
+    head = f"event: {event}\n" if event else ""
+    return head + "".join(f"data: {line}\n" for line in data.split("\n")) + "\n"
+
+@app.post("/api/explain-match")
+def api_explain_match():
+    """
+    Streams (text/event-stream) an LLM explanation of how a resume matches one job.
+    Accepts JSON:
+      - resume_text (optional if user_id provided)
+      - user_id (optional)
+      - job_id
+    """
+    payload = request.get_json(force=True) or {}
+    resume_text = (payload.get("resume_text") or "").strip()
+    user_id = payload.get("user_id")
+    if not resume_text and user_id:
+        res = get_latest_resume(user_id)
+        resume_text = (res or {}).get("text") or ""
+    if not resume_text:
+        return jsonify({"ok": False, "error": "resume_text or user_id required"}), 400
+    job = get_job_by_id(payload.get("job_id"))
+    if not job:
+        return jsonify({"ok": False, "error": "Job not found"}), 404
+
+    job_desc = build_full_job_desc(job.get("description", ""), job.get("skills", []),
+                                   job.get("responsibilities", []), job.get("qualifications", []))
+    prompt = (
+        f"Analyze how well this resume matches the job description. "
+        f"Provide a detailed explanation of the match, highlighting:\n"
+        f"1. Key skills that match\n"
+        f"2. Experience alignment\n"
+        f"3. Any gaps or areas for improvement\n\n"
+        f"Resume (first 2000 chars):\n{resume_text[:2000]}\n\n"
+        f"Job Description:\n{job_desc[:2000]}"
+    )
+
+    def generate():
+        try:
+            for chunk in chat_complete_stream(prompt):
+                yield _sse(chunk)
+        except Exception as e:
+            logger.warning("⚠️ Match explanation stream failed: %s", e)
+            yield _sse(str(e), event="error")
+        yield _sse("", event="done")
+
+    return app.response_class(stream_with_context(generate()), mimetype="text/event-stream",
+                              headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _send_notifications(candidate_name, candidate_email, job_title, percent, status, hr_email):
+    """Email HR (and the candidate, if configured) about a submitted application"""
+    try:
+        send_pass_notification(candidate_name, candidate_email, job_title, percent, status=status, recipient_email=hr_email)
+        if send_candidate_notification:
+            send_candidate_notification(candidate_name, candidate_email, job_title, percent, status=status)
+    except Exception:
+        logger.exception("Notification failed")
+
 @app.post("/api/submit-answers")
 def api_submit_answers():
     """
@@ -1276,21 +1846,32 @@ def api_submit_answers():
         if not user_id or not job_id:
             return jsonify({"ok": False, "error": "user_id and job.id required"}), 400
 
-        total_score = 0
-        results = {}
+        qa = []
         for idx, q in enumerate(questions):
             key = str(idx + 1)
-            ans = answers.get(key, "")
             if isinstance(q, dict):
                 qtxt = q.get("question") or q.get("text") or ""
             else:
                 qtxt = str(q)
-            validate_prompt = f"Job description: {job.get('description','')}\nQuestion: {qtxt}\nAnswer: {ans}\nAssess relevance from 0-100 and say if likely copied or original. Return JSON like {{'score':int,'originality':'original'|'copied','feedback':'...'}}"
-            out = chat_complete(validate_prompt)
-            try:
-                parsed = json.loads(out)
-            except Exception:
-                parsed = {"score": 70, "originality": "original", "feedback": out[:200]}
+            qa.append((key, qtxt, answers.get(key, "")))
+
+        # Validate answers in batches (one LLM call each, run concurrently); answers from a batch
+        # whose reply can't be parsed fall back to one call per answer. Results keep question order.
+        job_desc = job.get("description", "")
+        validations = []
+        if qa:
+            batches = [qa[i:i + VALIDATE_BATCH_SIZE] for i in range(0, len(qa), VALIDATE_BATCH_SIZE)]
+            batched = list(_POOL.map(lambda b: _validate_batch(job_desc, b), batches))
+            retry = [t for b, parsed in zip(batches, batched) if parsed is None for t in b]
+            if retry:
+                logger.warning("⚠️ Batch validation unparseable; validating %s answers individually", len(retry))
+                single = iter(_POOL.map(lambda t: _validate_answer(job_desc, t[1], t[2]), retry))
+            validations = [v for parsed, b in zip(batched, batches)
+                           for v in (parsed if parsed is not None else [next(single) for _ in b])]
+
+        total_score = 0
+        results = {}
+        for (key, qtxt, ans), parsed in zip(qa, validations):
             results[key] = {"question": qtxt, "answer": ans, "validation": parsed}
             total_score += int(parsed.get("score", 70))
         percent = round((total_score / (len(questions) * 100)) * 100, 2) if questions else 0
@@ -1300,14 +1881,12 @@ def api_submit_answers():
         hr_email = job.get("hr_email") or job.get("HR_EMAIL") or os.getenv("ADMIN_EMAIL")
         if send_pass_notification and hr_email:
             try:
-                cur = conn.cursor()
+                cur = _get_conn().cursor()
                 cur.execute("SELECT name, username FROM users WHERE id=?", (user_id,))
                 row = cur.fetchone()
                 if row:
-                    candidate_name, candidate_email = row
-                    send_pass_notification(candidate_name, candidate_email, job.get("title", ""), percent, status=status, recipient_email=hr_email)
-                    if send_candidate_notification:
-                        send_candidate_notification(candidate_name, candidate_email, job.get("title", ""), percent, status=status)
+                    # Emails are sent in the background so the response doesn't wait on SendGrid
+                    _POOL.submit(_send_notifications, row[0], row[1], job.get("title", ""), percent, status, hr_email)
             except Exception:
                 logger.exception("Notification failed")
         return jsonify({"ok": True, "application_id": app_id, "score": percent, "status": status, "results": results})
@@ -1320,40 +1899,37 @@ def api_my_applications():
     user_id = request.args.get("user_id")
     if not user_id:
         return jsonify({"ok": False, "error": "user_id required"}), 400
-    cur = conn.cursor()
-    cur.execute("SELECT id, job_id, score, status, submitted_at FROM applications WHERE user_id=?", (user_id,))
-    rows = cur.fetchall()
-    out = []
-    for r in rows:
-        jid = r[1]
-        cur2 = conn.cursor()
-        cur2.execute("SELECT title FROM jobs WHERE id=?", (jid,))
-        jt = cur2.fetchone()
-        out.append({"application_id": r[0], "job_id": jid, "job_title": jt[0] if jt else jid, "score": r[2], "status": r[3], "submitted_at": r[4]})
-    return jsonify(out)
+    cur = _get_conn().cursor()
+    # Job titles come from the same query (one round-trip instead of one lookup per application)
+    cur.execute("""SELECT a.id, a.job_id, a.score, a.status, a.submitted_at, j.title
+                   FROM applications a LEFT JOIN jobs j ON j.id = a.job_id
+                   WHERE a.user_id=?""", (user_id,))
+
+    def generate():
+        # Rows are encoded as they come off the cursor, so the full list is never materialized
+        yield b"["
+        for n, (aid, jid, score, status, submitted_at, title) in enumerate(cur):
+            yield (b"," if n else b"") + _json_dumpb({
+                "application_id": aid, "job_id": jid, "job_title": title if title is not None else jid,
+                "score": score, "status": status, "submitted_at": submitted_at})
+        yield b"]"
+    return app.response_class(generate(), mimetype="application/json")
 
 # Simple debug endpoint
 @app.get("/api/debug")
 def api_debug():
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM resumes")
-    resume_count = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM jobs")
-    job_count = cur.fetchone()[0]
+    cur = _get_conn().cursor()
+    cur.execute("""WITH r AS (SELECT COUNT(*) c FROM resumes), j AS (SELECT COUNT(*) c FROM jobs)
+                   SELECT r.c, j.c FROM r, j""")
+    resume_count, job_count = cur.fetchone()
     cur.execute("SELECT id, username FROM users LIMIT 5")
-    users = [{"id": r[0], "username": r[1]} for r in cur.fetchall()]
+    users = [{"id": uid, "username": username} for uid, username in cur.fetchall()]
     
-    # Get sample jobs
-    cur.execute("SELECT id, title, description FROM jobs LIMIT 3")
-    sample_jobs = []
-    for r in cur.fetchall():
-        sample_jobs.append({
-            "id": r[0],
-            "title": r[1],
-            "description_length": len(r[2] or "")
-        })
+    # Get sample jobs (SQLite measures the description, so its text is never fetched)
+    cur.execute("SELECT id, title, LENGTH(COALESCE(description, '')) FROM jobs LIMIT 3")
+    sample_jobs = [{"id": jid, "title": title, "description_length": n} for jid, title, n in cur.fetchall()]
     
-    return jsonify({
+    return app.response_class(_json_dumpb({
         "status": "ok",
         "resume_count": resume_count,
         "job_count": job_count,
@@ -1364,7 +1940,7 @@ def api_debug():
             "credentials_file": os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         },
         "match_threshold": os.getenv("MATCH_THRESHOLD", "50")
-    })
+    }), mimetype="application/json")
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5001))
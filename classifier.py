@@ -1,7 +1,13 @@
+import hashlib
 import logging
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
+from cachetools import LRUCache
 from dotenv import load_dotenv
 from openai import OpenAI
 from vertexai import init as vertexai_init
@@ -10,6 +16,12 @@ from vertexai.language_models import TextEmbeddingModel
 
 from gcp_secrets import get_secret
 
+# Optional SIMD cosine kernels (falls back to numpy when unavailable)
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
 # Load environment variables
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -17,15 +29,19 @@ logging.basicConfig(level=logging.INFO)
 # -----------------------------
 # 🔹 Vertex AI Setup
 # -----------------------------
+PROJECT_ID = os.getenv("PROJECT_ID") or os.getenv("VERTEX_PROJECT")
+REGION = os.getenv("REGION") or os.getenv("VERTEX_LOCATION", "us-central1")
+DEFAULT_PROJECT_ID = "titanium-portal-476620-s9"  # used by chat_complete when PROJECT_ID is unset
+_vertex_inited = False
+
 try:
     from vertexai import init
     from vertexai.language_models import TextEmbeddingModel
     from vertexai.generative_models import GenerativeModel
 
-    PROJECT_ID = os.getenv("PROJECT_ID") or os.getenv("VERTEX_PROJECT")
-    REGION = os.getenv("REGION") or os.getenv("VERTEX_LOCATION", "us-central1")
     if PROJECT_ID:
         init(project=PROJECT_ID, location=REGION)
+        _vertex_inited = True
         logging.info(f"✓ Vertex AI initialized (project={PROJECT_ID}, region={REGION})")
     else:
         logging.warning("⚠️ PROJECT_ID not set; Vertex AI may fail.")
@@ -57,19 +73,77 @@ else:
     logging.warning("ℹ️ OPENAI_API_KEY not set; OpenAI will not be available")
 
 
+# Provider/model that get_embedding prefers; part of persistent cache keys so a model
+# switch never serves vectors from the old embedding space
+EMBED_MODEL = "vertex/text-embedding-004" if USE_VERTEX else "openai/text-embedding-3-small"
+
+
+# Vertex model handles, built once on first use and shared across threads
+_VERTEX_EMB = None
+_GEN_MODEL = None
+_model_lock = threading.Lock()
+
+
+def _embedding_model():
+    global _VERTEX_EMB
+    if _VERTEX_EMB is None:
+        with _model_lock:
+            if _VERTEX_EMB is None:
+                _VERTEX_EMB = TextEmbeddingModel.from_pretrained("text-embedding-004")
+    return _VERTEX_EMB
+
+
+def _chat_model():
+    global _GEN_MODEL
+    if _GEN_MODEL is None:
+        with _model_lock:
+            if _GEN_MODEL is None:
+                _GEN_MODEL = GenerativeModel("gemini-1.5-flash-latest")  # or "gemini-1.5-pro-001"
+    return _GEN_MODEL
+
+
 # -----------------------------
 # 🔹 Embedding Function
 # -----------------------------
-def get_embedding(text: str):
-    """Generate embeddings using Vertex AI or OpenAI"""
+# Successful embeddings keyed by a 128-bit content hash, so repeated resume/job texts are embedded once
+_VEC_CACHE = LRUCache(maxsize=10000)
+_vec_cache_lock = threading.Lock()
+
+
+def _text_key(text):
+    return hashlib.blake2b(text.encode("utf-8", "ignore"), digest_size=16).digest()
+
+
+def _remember(key, v):
+    """Cache a fetched embedding (failed all-zero vectors are not cached); returns it read-only"""
+    v.flags.writeable = False
+    if v.any():
+        with _vec_cache_lock:
+            _VEC_CACHE[key] = v
+    return v
+
+
+def get_embedding(text: str, refresh: bool = False):
+    """Generate embeddings using Vertex AI or OpenAI (cached by content hash; refresh re-fetches)"""
     if not text or len(text.strip()) == 0:
         return np.zeros(768)
+    key = _text_key(text)
+    v = None
+    if not refresh:
+        with _vec_cache_lock:
+            v = _VEC_CACHE.get(key)
+    if v is None:
+        v = _remember(key, _fetch_embedding(text))
+    return v
+
+
+def _fetch_embedding(text):
+    """Embed one text with Vertex AI, falling back to OpenAI (zeros on failure)"""
 
     # Try Vertex AI
     if USE_VERTEX:
         try:
-            embedding_model = TextEmbeddingModel.from_pretrained("text-embedding-004")
-            embeddings = embedding_model.get_embeddings([text])
+            embeddings = _embedding_model().get_embeddings([text])
             return np.array(embeddings[0].values)
         except Exception as e:
             logging.warning(f"⚠️ Vertex embedding failed: {e}")
@@ -86,13 +160,113 @@ def get_embedding(text: str):
         return np.zeros(1536)
 
 
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))  # Inputs per provider request (Vertex caps a request at 250)
+EMBED_BATCH_CHARS = int(os.getenv("EMBED_BATCH_CHARS", "40000"))  # Characters per request; Vertex caps one at ~20k tokens
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "8"))
+EMBED_RETRIES = 3
+
+
+def _fetch_one(text):
+    """get_embedding with jittered start and exponential backoff (it returns zeros on failure)"""
+    time.sleep(random.uniform(0, 0.05))  # spread the burst so workers don't hit a 429 together
+    for attempt in range(EMBED_RETRIES):
+        v = get_embedding(text)
+        if v.any() or attempt == EMBED_RETRIES - 1:
+            break
+        time.sleep((2 ** attempt) * 0.5 + random.uniform(0, 0.25))
+    return v
+
+
+def _embed_batches(idx, texts):
+    """Split indexes into runs of at most EMBED_BATCH_SIZE inputs and EMBED_BATCH_CHARS characters"""
+    batch, chars = [], 0
+    for i in idx:
+        n = len(texts[i])
+        if batch and (len(batch) >= EMBED_BATCH_SIZE or chars + n > EMBED_BATCH_CHARS):
+            yield batch
+            batch, chars = [], 0
+        batch.append(i)
+        chars += n
+    if batch:
+        yield batch
+
+def get_embeddings(texts):
+    """Embed a list of texts with one provider request per batch (see _embed_batches)"""
+    texts = list(texts)
+    vectors = [None] * len(texts)
+    pending = []
+    with _vec_cache_lock:
+        for i, t in enumerate(texts):
+            if t and t.strip():
+                vectors[i] = _VEC_CACHE.get(_text_key(t))
+                if vectors[i] is None:
+                    pending.append(i)
+            else:
+                vectors[i] = np.zeros(768)
+
+    for idx in _embed_batches(pending, texts):
+        batch = [texts[i] for i in idx]
+        values = None
+
+        # Try Vertex AI
+        if USE_VERTEX:
+            try:
+                values = [e.values for e in _embedding_model().get_embeddings(batch)]
+            except Exception as e:
+                logging.warning(f"⚠️ Vertex batch embedding failed: {e}")
+
+        # Fallback → OpenAI
+        if values is None:
+            try:
+                response = openai_client.embeddings.create(
+                    model="text-embedding-3-small",
+                    input=batch
+                )
+                values = [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+            except Exception as e:
+                logging.error(f"⚠️ OpenAI batch embedding failed: {e}")
+
+        # No batch endpoint available → single requests, fired concurrently
+        if values is None:
+            with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as ex:
+                values = list(ex.map(_fetch_one, batch))
+
+        for i, v in zip(idx, values):
+            vectors[i] = _remember(_text_key(texts[i]), np.array(v))
+    return vectors
+
+
 # -----------------------------
 # 🔹 Cosine Similarity
 # -----------------------------
+def _simd_operands(a, b):
+    """Contiguous operands with a dtype SimSIMD accepts (int8 stays int8, else float32)"""
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype != np.int8 or b.dtype != np.int8:
+        a, b = a.astype(np.float32), b.astype(np.float32)
+    return np.ascontiguousarray(a), np.ascontiguousarray(b)
+
+
 def cosine_similarities(vec1, vec2):
     """Compute cosine similarity between two vectors"""
-    from sklearn.metrics.pairwise import cosine_similarity
-    return float(cosine_similarity([vec1], [vec2])[0][0])
+    if simsimd is not None:
+        a, b = _simd_operands(vec1, vec2)
+        if not a.any() or not b.any():
+            return 0.0  # failed (all-zero) embeddings never match
+        return float(1 - simsimd.cosine(a, b))
+    a, b = np.asarray(vec1, dtype=np.float32), np.asarray(vec2, dtype=np.float32)
+    return float(np.dot(a, b) / np.sqrt(np.vdot(a, a) * np.vdot(b, b) + 1e-12))
+
+
+def quantize_embedding(vec):
+    """L2-normalize an embedding and quantize it to int8 with a per-vector scale (storage only; dequantized before scoring)"""
+    v = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    if not norm:
+        return np.zeros(v.shape, dtype=np.int8), 0.0
+    v = v / norm
+    scale = float(np.abs(v).max()) / 127
+    return np.clip(np.round(v / scale), -127, 127).astype(np.int8), scale
 
 
 # -----------------------------
@@ -109,31 +283,43 @@ def match_resume_to_job(resume_text, job_description):
 # -----------------------------
 # 🔹 LLM Text Completion
 # -----------------------------
-def chat_complete(prompt: str):
-    """Generate AI text using Vertex AI (Gemini) or OpenAI with fallback."""
-    # Initialize Vertex AI
-    try:
-        vertexai_init(project="titanium-portal-476620-s9", location="us-central1")
-    except Exception as e:
-        logging.warning(f"⚠️ Vertex initialization failed: {e}")
+# Preferred chat provider/model, for callers that cache LLM output across restarts
+CHAT_MODEL = "vertex/gemini-1.5-flash-latest" if USE_VERTEX else "openai/gpt-4o-mini"
+CHAT_UNAVAILABLE = "Sorry, AI response could not be generated at the moment."
+
+def _ensure_vertex_init():
+    """Initialize Vertex AI once (skipped when the import-time init already succeeded)"""
+    global _vertex_inited
+    if not _vertex_inited:
+        try:
+            vertexai_init(project=PROJECT_ID or DEFAULT_PROJECT_ID, location=REGION)
+            _vertex_inited = True
+        except Exception as e:
+            logging.warning(f"⚠️ Vertex initialization failed: {e}")
+
+def chat_complete(prompt: str, keyword_fallback: bool = True):
+    """Generate AI text using Vertex AI (Gemini) or OpenAI with fallback.
+
+    keyword_fallback=False skips the prompt-keyword answer on a Vertex failure, for callers that persist the output.
+    """
+    _ensure_vertex_init()
 
     # Try Vertex AI first
     if USE_VERTEX:
         try:
-            # ✅ Updated model ID
-            model = GenerativeModel("gemini-1.5-flash-latest")  # or "gemini-1.5-pro-001"
-            response = model.generate_content(prompt)
+            response = _chat_model().generate_content(prompt)
             if response and hasattr(response, "text") and response.text:
                 return response.text.strip()
         except Exception as e:
             logging.warning(f"⚠️ Vertex chat_complete failed: {e}")
             # Optional: simple keyword fallback if model fails
-            try:
-                import re
-                keywords = re.findall(r'\b[A-Z][a-zA-Z]+\b', prompt)
-                return " ".join(keywords[:10]) or "general job search"
-            except Exception:
-                pass
+            if keyword_fallback:
+                try:
+                    import re
+                    keywords = re.findall(r'\b[A-Z][a-zA-Z]+\b', prompt)
+                    return " ".join(keywords[:10]) or "general job search"
+                except Exception:
+                    pass
 
     # Fallback → OpenAI
     if openai_client:
@@ -149,7 +335,52 @@ def chat_complete(prompt: str):
             logging.error(f"⚠️ OpenAI chat_complete failed: {e}")
 
     # Final fallback
-    return "Sorry, AI response could not be generated at the moment."
+    return CHAT_UNAVAILABLE
+
+def chat_complete_stream(prompt: str):
+    """Like chat_complete, but yields the text in chunks as the model generates it"""
+    _ensure_vertex_init()
+
+    # Try Vertex AI first; fall back only if it fails before producing any text
+    sent = False
+    if USE_VERTEX:
+        try:
+            for chunk in _chat_model().generate_content(prompt, stream=True):
+                text = getattr(chunk, "text", "")
+                if text:
+                    sent = True
+                    yield text
+            if sent:
+                return
+        except Exception as e:
+            logging.warning(f"⚠️ Vertex chat_complete_stream failed: {e}")
+            if sent:
+                return
+
+    # Fallback → OpenAI
+    if openai_client:
+        try:
+            stream = openai_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=300,
+                temperature=0.4,
+                stream=True,
+            )
+            for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    sent = True
+                    yield text
+            if sent:
+                return
+        except Exception as e:
+            logging.error(f"⚠️ OpenAI chat_complete_stream failed: {e}")
+            if sent:
+                return
+
+    # Final fallback
+    yield CHAT_UNAVAILABLE
 
 def build_rag_search_prompt(resume_text: str, top_k: int = 10) -> str:
     return f"""
@@ -174,9 +405,3 @@ Search Query: <short query string>
 Keywords: <comma-separated list of up to 5 key skills>
 Limit to {top_k} results.
     """.strip()
-
-      
-def build_rag_search_prompt(resume_text: str, top_k: int = 10) -> str:
-    prompt = build_rag_search_prompt(resume_text)
-    query = chat_complete(prompt).strip()
-    return query
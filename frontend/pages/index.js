@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 
 const API = process.env.NEXT_PUBLIC_API || 'http://localhost:5001/api'
 //const adminAllowedDomains = (process.env.NEXT_PUBLIC_ADMIN_DOMAINS || 'ealliancecorp.com').split(',').map(d => d.trim().toLowerCase()).filter(Boolean)
@@ -15,6 +15,7 @@ export default function Home() {
   const [matches, setMatches] = useState([])
   const [showRegister, setShowRegister] = useState(false)
   const [editingJob, setEditingJob] = useState(null)
+  const pendingUpload = useRef(null) // resolves true once the last uploaded resume is ready
 
   useEffect(() => {
     try {
@@ -88,9 +89,16 @@ export default function Home() {
 
   const listJobs = async () => {
     try {
-      const res = await fetch(`${API}/jobs`)
-      const data = await res.json()
-      setJobs(data || [])
+      // /api/jobs is paginated; fetch pages until a short page comes back
+      const pageSize = 200
+      let all = []
+      for (let offset = 0; ; offset += pageSize) {
+        const res = await fetch(`${API}/jobs?limit=${pageSize}&offset=${offset}`)
+        const page = (await res.json()) || []
+        all = all.concat(page)
+        if (page.length < pageSize) break
+      }
+      setJobs(all)
     } catch (err) {
       console.error('Failed to load jobs:', err)
       setJobs([])
@@ -193,11 +201,27 @@ export default function Home() {
     }
   }
 
+  const waitForResume = async (resumeId) => {
+    // Text extraction runs in the background; poll until the resume is ready (as seeker.js does)
+    for (let i = 0; i < 120; i++) {
+      const st = await (await fetch(`${API}/resumes/${resumeId}/status`)).json()
+      if (st.status === 'ready') return true
+      if (st.status === 'failed') {
+        alert(st.error || 'Could not extract text from resume')
+        return false
+      }
+      await new Promise(resolve => setTimeout(resolve, 500))
+    }
+    return true
+  }
+
   const uploadResume = async () => {
     if (!user || !file) return
     const fd = new FormData(); fd.append('user_id', user.id); fd.append('file', file)
     const res = await fetch(`${API}/upload-resume`, { method: 'POST', body: fd })
-    const data = await res.json(); if (!data.ok) alert(data.error)
+    const data = await res.json(); if (!data.ok) { alert(data.error); return }
+    pendingUpload.current = data.status === 'ready' ? null : waitForResume(data.resume_id)
+    await pendingUpload.current
   }
   const handleMatch = async () => {
     const res = await fetch("http://localhost:5000/api/rag-search", {
@@ -218,6 +242,7 @@ export default function Home() {
     }
   };
   const runMatch = async () => {
+    if (pendingUpload.current && !(await pendingUpload.current)) return
     const res = await fetch(`${API}/match`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ user_id: user.id })})
     const data = await res.json(); if (data.ok) setMatches(data.matches)
   }
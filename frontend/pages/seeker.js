@@ -166,6 +166,13 @@ export default function Seeker() {
       if (!data.ok) {
         throw new Error(data.error || 'Failed to upload resume')
       }
+      // Text extraction runs in the background; wait until the resume is ready
+      for (let i = 0; i < 120; i++) {
+        const st = await (await fetch(`${API}/resumes/${data.resume_id}/status`)).json()
+        if (st.status === 'ready') break
+        if (st.status === 'failed') throw new Error(st.error || 'Could not extract text from resume')
+        await new Promise(resolve => setTimeout(resolve, 500))
+      }
       setResumeUploaded(true)
       setResumeError('')
       return true
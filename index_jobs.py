@@ -1,7 +1,6 @@
 # backend/index_jobs.py
 import json
-from classifier import get_embedding
-from vector_store import build_faiss_index
+from vector_store import build_index
 from pathlib import Path
 import sqlite3
 
@@ -14,12 +13,16 @@ def fetch_jobs_from_db():
     rows = cur.fetchall()
     jobs = []
     for r in rows:
-        jid, title, desc, skills_json = r
+        jid, title, desc, skills_text = r
         skills = []
-        try:
-            skills = json.loads(skills_json) if skills_json else []
-        except Exception:
-            skills = []
+        if skills_text and skills_text.startswith("["):
+            # Legacy JSON-encoded rows (app.py migrates these on startup)
+            try:
+                skills = json.loads(skills_text)
+            except Exception:
+                skills = []
+        elif skills_text:
+            skills = skills_text.split("|")
         text = " ".join([title or "", desc or "", " ".join(skills)])
         jobs.append({"id": jid, "title": title, "description": desc, "text": text})
     conn.close()
@@ -30,9 +33,12 @@ def index_jobs():
     if not jobs:
         print("No jobs found to index.")
         return
-    index, meta = build_faiss_index(jobs, embedding_fn=get_embedding)
+    # Struct-of-arrays: row i of the index belongs to job_ids[i] / job_titles[i]
+    job_ids = [j["id"] for j in jobs]
+    job_titles = [j["title"] for j in jobs]
+    index = build_index([j["text"] for j in jobs])
     print(f"Indexed {len(jobs)} jobs.")
-    return index, meta
+    return job_ids, job_titles, index
 
 if __name__ == "__main__":
     index_jobs()
@@ -9,9 +9,9 @@ import json
 import os
 from typing import Any, Dict, List, Optional
 
-import requests
+import httpx
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from pydantic import BaseModel
 
 from gcp_secrets import get_secret
@@ -44,6 +44,27 @@ tool_registry = ToolRegistry()
 
 SERPAPI_KEY = get_secret("SERPAPI_KEY", required=False)
 
+# Shared async HTTP client: pooled keep-alive connections, and tool calls never block the event loop
+HTTPX = httpx.AsyncClient(timeout=60, limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await HTTPX.aclose()
+
+SERPAPI_PAGE_SIZE = 10  # google_jobs results per page
+# Concurrent SerpAPI page requests per search (stays within SerpAPI's rate limits)
+SERPAPI_PAGE_CONCURRENCY = 5
+# Upper bound on `limit`; every page is a billed SerpAPI request
+SERPAPI_MAX_RESULTS = 100
+
+async def _serpapi_page(params: dict, start: int, sem: asyncio.Semaphore) -> List[dict]:
+    """One page of google_jobs results"""
+    async with sem:
+        response = await HTTPX.get("https://serpapi.com/search", params={**params, "start": start}, timeout=30)
+    response.raise_for_status()
+    data = response.json() or {}
+    return data.get("jobs_results", []) or []
+
 # Register tools
 tool_registry.register_tool(
     "search_jobs",
@@ -53,7 +74,7 @@ tool_registry.register_tool(
         "properties": {
             "query": {"type": "string", "description": "Job search query"},
             "location": {"type": "string", "description": "Job location"},
-            "limit": {"type": "integer", "description": "Number of results"}
+            "limit": {"type": "integer", "description": f"Number of results (1-{SERPAPI_MAX_RESULTS})"}
         },
         "required": ["query"]
     }
@@ -99,7 +120,7 @@ async def search_jobs_tool(request_data: Dict[str, Any]):
     try:
         query = request_data.get("query", "")
         location = request_data.get("location", os.getenv("JOB_LOCATION", "United States"))
-        limit = request_data.get("limit", 10)
+        limit = min(max(int(request_data.get("limit", 10)), 1), SERPAPI_MAX_RESULTS)
         
         if not query:
             raise HTTPException(status_code=400, detail="query is required")
@@ -118,17 +139,29 @@ async def search_jobs_tool(request_data: Dict[str, Any]):
             "q": query,
             "api_key": api_key,
             "location": location,
-            "num": limit
+            "num": SERPAPI_PAGE_SIZE
         }
         
-        response = requests.get("https://serpapi.com/search", params=params, timeout=30)
-        response.raise_for_status()
-        data = response.json() or {}
-        items = data.get("jobs_results", []) or []
+        # Fetch every page needed for `limit` concurrently
+        pages = max(1, -(-limit // SERPAPI_PAGE_SIZE))
+        sem = asyncio.Semaphore(SERPAPI_PAGE_CONCURRENCY)
+        responses = await asyncio.gather(*(_serpapi_page(params, p * SERPAPI_PAGE_SIZE, sem) for p in range(pages)),
+                                         return_exceptions=True)
+        # A failed first page fails the search; a failed later page just yields fewer results
+        if isinstance(responses[0], Exception):
+            raise responses[0]
+        items = [item for page in responses if not isinstance(page, Exception) for item in page]
         
         results = []
-        for item in items[:limit]:
+        seen = set()
+        for item in items:
+            if len(results) >= limit:
+                break
             if isinstance(item, dict) and item.get("title"):
+                key = (item.get("title"), item.get("company_name"))
+                if key in seen:
+                    continue  # the same posting can show up on several pages
+                seen.add(key)
                 results.append({
                     "title": item.get("title", ""),
                     "company": item.get("company_name", ""),
@@ -142,7 +175,7 @@ async def search_jobs_tool(request_data: Dict[str, Any]):
         return {"ok": False, "error": str(e), "results": []}
 
 @app.post("/tools/match_resume_to_jobs")
-async def match_resume_tool(request_data: Dict[str, Any]):
+async def match_resume_tool(request_data: Dict[str, Any], x_cache_key: Optional[str] = Header(None)):
     """Match resume to jobs using RAG"""
     try:
         resume_text = request_data.get("resume_text", "")
@@ -153,13 +186,15 @@ async def match_resume_tool(request_data: Dict[str, Any]):
         
         # Call the internal RAG endpoint
         internal_api = os.getenv("INTERNAL_API_URL", "http://localhost:5001")
-        response = requests.post(
+        response = await HTTPX.post(
             f"{internal_api}/api/rag-search",
             json={
                 "resume_text": resume_text,
                 "top_k": top_k,
                 "rerank_with_llm": True
             },
+            # Passed through so a caller whose resume changed can skip the cached resume embedding
+            headers={"X-Cache-Key": x_cache_key} if x_cache_key else None,
             timeout=60
         )
         
@@ -182,7 +217,7 @@ async def get_job_details_tool(request_data: Dict[str, Any]):
         
         # Call the internal API
         internal_api = os.getenv("INTERNAL_API_URL", "http://localhost:5001")
-        response = requests.get(
+        response = await HTTPX.get(
             f"{internal_api}/api/jobs/{job_id}",
             timeout=30
         )
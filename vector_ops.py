@@ -0,0 +1,49 @@
+# backend/vector_ops.py
+import numpy as np
+
+# Optional JIT kernels (falls back to numpy when numba is unavailable)
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _cosine_matrix(r, J):
+        n, d = J.shape
+        out = np.empty(n, dtype=np.float32)
+        sum_r2 = np.float32(0.0)
+        for k in range(d):
+            sum_r2 += r[k] * r[k]
+        for i in prange(n):
+            dot = np.float32(0.0)
+            sum_j2 = np.float32(0.0)
+            for k in range(d):
+                x = J[i, k]
+                dot += r[k] * x
+                sum_j2 += x * x
+            denom = np.sqrt(sum_r2 * sum_j2)
+            out[i] = dot / denom if denom > 0 else 0.0
+        return out
+
+
+def cosine_matrix(r, J):
+    """Cosine similarity of vector r against every row of the (N, D) matrix J"""
+    r = np.ascontiguousarray(r, dtype=np.float32)
+    J = np.ascontiguousarray(J, dtype=np.float32)
+    if r.ndim != 1 or J.ndim != 2 or J.shape[1] != r.shape[0]:
+        # Mixed dimensions (e.g. a failed embedding's zero fallback): no similarity rather than reading past r
+        return np.zeros(J.shape[0] if J.ndim == 2 else 0, dtype=np.float32)
+    if not len(J):
+        return np.zeros(0, dtype=np.float32)
+    if njit is not None:
+        return _cosine_matrix(r, J)
+    denom = np.linalg.norm(J, axis=1) * np.linalg.norm(r)
+    dots = J @ r
+    return np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+
+
+def warmup():
+    """Compile the JIT kernel up front so the first request doesn't pay for it"""
+    cosine_matrix(np.ones(4, dtype=np.float32), np.ones((2, 4), dtype=np.float32))
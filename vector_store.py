@@ -1,19 +1,76 @@
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from classifier import get_embedding
+from classifier import get_embedding, get_embeddings
+from vector_ops import cosine_matrix
 
-# --- Create a simple in-memory vector index using numpy + sklearn ---
+# Optional SIMD kernels (falls back to the numba/numpy kernel in vector_ops when unavailable)
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+# --- Create a simple in-memory vector index using numpy ---
+
+# Mean of the normalized job vectors from the last build_index; avg cosine to the corpus is one dot with it
+MEAN_NORMED = None
+
+def _normalize_rows(mat):
+    """L2-normalize each row (zero rows stay zero)"""
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat / np.maximum(norms, 1e-12)
+
+def _quantize_rows(mat):
+    """Symmetric int8 quantization with a per-row scale of max|x| / 127"""
+    scale = np.abs(mat).max(axis=-1, keepdims=True) / 127
+    return np.round(mat / np.maximum(scale, 1e-12)).astype(np.int8)
+
+def mean_normed(normed):
+    """Centroid of unit-length rows (None for an empty matrix)"""
+    return np.asarray(normed, dtype=np.float32).mean(axis=0) if len(normed) else None
 
 def build_index(job_descriptions):
-    """Build in-memory embeddings index for all jobs"""
-    embeddings = [get_embedding(job) for job in job_descriptions]
-    return np.array(embeddings)
+    """Build in-memory embeddings index for all jobs
+
+    Rows are L2-normalized, then quantized to int8 (a quarter of the float32 bandwidth). Cosine
+    similarity is scale-invariant, so the per-row scales are not kept.
+    """
+    global MEAN_NORMED
+    embeddings = get_embeddings(job_descriptions)  # batched provider requests
+    normed = _normalize_rows(np.array(embeddings, dtype=np.float32))
+    MEAN_NORMED = mean_normed(normed)
+    return np.ascontiguousarray(_quantize_rows(normed))  # row-major for the GEMV / SIMD scans
+
+def avg_cosine_to_corpus(query_emb, corpus_mean=None):
+    """Mean cosine similarity of query_emb to every indexed job, in O(D)
+
+    Useful to screen out generic queries before per-job scoring. Defaults to the last build_index;
+    0.0 without a corpus or when the dimensions differ.
+    """
+    corpus_mean = MEAN_NORMED if corpus_mean is None else corpus_mean
+    query_emb = np.asarray(query_emb, dtype=np.float32)
+    if corpus_mean is None or corpus_mean.shape != query_emb.shape:
+        return 0.0
+    return float(np.dot(query_emb / max(np.linalg.norm(query_emb), 1e-12), corpus_mean))
 
 def search_index(query_text, job_descriptions, job_embeddings, top_k=5):
-    """Search jobs using cosine similarity (no FAISS needed)"""
-    query_emb = get_embedding(query_text)
-    sims = cosine_similarity([query_emb], job_embeddings)[0]
-    top_indices = sims.argsort()[::-1][:top_k]
+    """Search jobs using cosine similarity (no FAISS needed)
+
+    job_descriptions and job_embeddings are parallel arrays: row i of the build_index matrix is job i.
+    """
+    query_emb = np.asarray(get_embedding(query_text), dtype=np.float32)
+    query_emb = query_emb / max(np.linalg.norm(query_emb), 1e-12)
+    if simsimd is not None and job_embeddings.dtype == np.int8 and len(job_embeddings) and query_emb.any():
+        # SimSIMD's native int8 cosine
+        q = _quantize_rows(query_emb[None, :])
+        sims = 1 - np.asarray(simsimd.cdist(q, job_embeddings, metric="cosine"))[0]
+    else:
+        # Parallel numba kernel (numpy when numba is unavailable)
+        sims = cosine_matrix(query_emb, job_embeddings)
+    # Partial selection of the top_k, then sort only those
+    if top_k < len(sims):
+        top_indices = np.argpartition(-sims, top_k)[:top_k]
+    else:
+        top_indices = np.arange(len(sims))
+    top_indices = top_indices[np.argsort(-sims[top_indices])]
     results = [
         {"job": job_descriptions[i], "score": round(float(sims[i]) * 100, 2)}
         for i in top_indices
@@ -4,168 +4,396 @@ Script to verify Vertex AI configuration
 Run this to check if your Vertex AI setup is correct
 """
 
+import argparse
+import json
+import logging
 import os
+import stat
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
+    _JSONDecodeError = json.JSONDecodeError
 
-print("=" * 60)
-print("Vertex AI Configuration Verification")
-print("=" * 60)
-print()
+# The settings the checks read
+_CFG_KEYS = ("USE_VERTEX", "GOOGLE_APPLICATION_CREDENTIALS", "VERTEX_PROJECT", "PROJECT_ID",
+             "VERTEX_LOCATION", "REGION", "VERTEX_EMBEDDING_MODEL", "VERTEX_CHAT_MODEL")
 
-# Check 1: USE_VERTEX flag
-use_vertex = os.getenv("USE_VERTEX", "false").lower() == "true"
-print(f"1. USE_VERTEX enabled: {'✓ YES' if use_vertex else '✗ NO (using OpenAI)'}")
-if not use_vertex:
-    print("   → Set USE_VERTEX=true in .env to use Vertex AI")
-    sys.exit(0)
+# The _CFG_KEYS values parsed from .env on the last run, reused while the file's (mtime_ns, size) is
+# unchanged. Only those non-secret settings are written; API keys and other .env entries never are.
+_ENV_CACHE_FILE = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "novum" / "vertex_env_cache.json"
+_O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
 
-print()
 
-# Check 2: Google Application Credentials
-credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-if not credentials_path:
-    print("2. GOOGLE_APPLICATION_CREDENTIALS: ✗ NOT SET")
-    print("   → Set GOOGLE_APPLICATION_CREDENTIALS in .env")
-    sys.exit(1)
+def _read_env_cache(key):
+    """Cached .env values for key, or None (missing, stale, or not a regular file owned by this user)"""
+    try:
+        fd = os.open(_ENV_CACHE_FILE, os.O_RDONLY | _O_NOFOLLOW)
+    except OSError:
+        return None
+    with os.fdopen(fd, "rb") as f:
+        st = os.fstat(f.fileno())
+        if not stat.S_ISREG(st.st_mode) or (hasattr(os, "getuid") and st.st_uid != os.getuid()):
+            return None
+        try:
+            cached = json.loads(f.read())
+            return cached["vars"] if cached.get("key") == key else None
+        except (OSError, ValueError, KeyError, AttributeError):
+            return None
 
-print(f"2. GOOGLE_APPLICATION_CREDENTIALS: {credentials_path}")
 
-if not os.path.isfile(credentials_path):
-    print(f"   ✗ File not found at: {credentials_path}")
-    sys.exit(1)
+def _write_env_cache(key, values):
+    """Replace the cache file atomically with a freshly created (O_EXCL) private file"""
+    tmp = _ENV_CACHE_FILE.with_name(f"{_ENV_CACHE_FILE.name}.{os.getpid()}.tmp")
+    try:
+        _ENV_CACHE_FILE.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _O_NOFOLLOW, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"key": key, "vars": values}, f)
+        os.replace(tmp, _ENV_CACHE_FILE)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
 
-print(f"   ✓ File exists")
 
-# Check if it's a valid JSON
-try:
-    import json
-    with open(credentials_path, 'r') as f:
-        creds = json.load(f)
-        project_id_from_creds = creds.get('project_id', 'Not found')
-        print(f"   ✓ Valid JSON file")
-        print(f"   → Project ID in credentials: {project_id_from_creds}")
-except Exception as e:
-    print(f"   ✗ Invalid JSON file: {e}")
-    sys.exit(1)
-
-print()
-
-# Check 3: Project ID
-project = os.getenv("VERTEX_PROJECT") or os.getenv("PROJECT_ID")
-if not project:
-    print("3. VERTEX_PROJECT: ✗ NOT SET")
-    print("   → Set VERTEX_PROJECT=titanium-portal-476620 (or your project ID) in .env")
-    sys.exit(1)
-
-print(f"3. VERTEX_PROJECT: {project}")
-print("   ✓ Set")
-
-# Verify project matches credentials
-if project_id_from_creds and project_id_from_creds != project:
-    print(f"   ⚠ Warning: Project in credentials ({project_id_from_creds}) doesn't match VERTEX_PROJECT ({project})")
-
-print()
-
-# Check 4: Location
-location = os.getenv("VERTEX_LOCATION") or os.getenv("REGION") or "us-central1"
-print(f"4. VERTEX_LOCATION: {location}")
-print("   ✓ Set (default: us-central1)")
-
-print()
-
-# Check 5: Test Vertex AI Import
-print("5. Testing Vertex AI imports...")
-try:
-    from vertexai import init as vertex_init
-    from vertexai.language_models import TextEmbeddingModel
-    from vertexai.generative_models import GenerativeModel
-    print("   ✓ Imports successful")
-except ImportError as e:
-    print(f"   ✗ Import failed: {e}")
-    print("   → Install: pip install google-cloud-aiplatform")
-    sys.exit(1)
-
-print()
-
-# Check 6: Test Vertex AI Initialization
-print("6. Testing Vertex AI initialization...")
-try:
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
-    vertex_init(project=project, location=location)
-    print("   ✓ Initialization successful")
-except Exception as e:
-    print(f"   ✗ Initialization failed: {e}")
-    print()
-    print("   Common issues:")
-    print("   - Vertex AI API not enabled in Google Cloud Console")
-    print("   - Service account lacks permissions")
-    print("   - Wrong project ID or location")
-    print("   - Insufficient permissions on the service account")
-    sys.exit(1)
-
-print()
-
-# Check 7: Test Model Loading
-print("7. Testing model loading...")
-try:
-    embedding_model = os.getenv("VERTEX_EMBEDDING_MODEL", "text-embedding-004")
-    chat_model = os.getenv("VERTEX_CHAT_MODEL", "gemini-1.5-flash")
-    
-    print(f"   → Loading embedding model: {embedding_model}")
-    emb_model = TextEmbeddingModel.from_pretrained(embedding_model)
-    print("   ✓ Embedding model loaded")
-    
-    print(f"   → Loading chat model: {chat_model}")
-    gen_model = GenerativeModel(chat_model)
-    print("   ✓ Chat model loaded")
-except Exception as e:
-    print(f"   ✗ Model loading failed: {e}")
-    print("   → Check if models are available in your region")
-    sys.exit(1)
-
-print()
-
-# Check 8: Test API Access
-print("8. Testing API access with sample call...")
-try:
-    test_text = "Hello, this is a test"
-    print(f"   → Getting embedding for: '{test_text}'")
-    embeddings = emb_model.get_embeddings([test_text])
-    if embeddings and len(embeddings) > 0:
-        print(f"   ✓ Embedding generated successfully (dimension: {len(embeddings[0].values)})")
-    else:
-        print("   ✗ No embeddings returned")
-        sys.exit(1)
-except Exception as e:
-    error_msg = str(e)
-    if "403" in error_msg or "Permission denied" in error_msg:
-        print(f"   ✗ Permission denied: {e}")
-        print()
-        print("   → Enable Vertex AI API in Google Cloud Console:")
-        print(f"     https://console.cloud.google.com/apis/library/aiplatform.googleapis.com?project={project}")
-        print()
-        print("   → Grant your service account these roles:")
-        print("     - roles/aiplatform.user")
-        print("     - roles/serviceusage.serviceUsageConsumer")
+def _load_env(env_file):
+    """Load the _CFG_KEYS settings from env_file without overriding what is already set (like load_dotenv)"""
+    st = env_file.stat()
+    key = [str(env_file.resolve()), st.st_mtime_ns, st.st_size]
+    values = _read_env_cache(key)
+    if values is None:
+        try:
+            from dotenv import dotenv_values
+        except ImportError:
+            return
+        parsed = dotenv_values(env_file)
+        values = {k: parsed[k] for k in _CFG_KEYS if parsed.get(k) is not None}
+        _write_env_cache(key, values)
+
+    for k, v in values.items():
+        if k in _CFG_KEYS:  # a cache written before the key filter may hold more
+            os.environ.setdefault(k, v)
+
+
+# Service-account JSON files are a few KB; anything past this is not one
+_MAX_CREDS_BYTES = 65536
+
+# Credentials files by path ({"raw": bytes, "creds": dict}), so later callers in this process don't re-read them
+_CREDS_CACHE = {}
+
+# Texts for the check 8 probe, sent as one batched request (the app's get_embeddings path)
+_PROBE_TEXTS = ["hello", "world", "vertex"]
+
+_BAR = "=" * 60
+_NL = "\n"
+_BAR_LINE = _BAR + _NL
+
+# Report lines are buffered and written once per check (one write instead of one per line)
+OUT = []
+emit = OUT.append
+
+
+def flush():
+    """Write the buffered report lines to stdout"""
+    sys.stdout.write("".join(OUT))
+    sys.stdout.flush()
+    OUT.clear()
+
+
+def drain():
+    """Take the buffered report lines as a list of stripped, non-empty messages (for --json)"""
+    lines = [line.strip() for line in "".join(OUT).splitlines() if line.strip()]
+    OUT.clear()
+    return lines
+
+
+# JSON-lines records for --json, one per check plus a summary
+log = logging.getLogger("verify_vertex_ai")
+
+
+# Snapshot of the settings the checks read, filled in by main() (os.environ is only written back for the SDK)
+CFG = {}
+
+
+def check_use_vertex(ctx):
+    """Check 1: USE_VERTEX flag (disabled is not a failure, the run just stops with exit 0)"""
+    use_vertex = (CFG.get("USE_VERTEX") or "false").lower() == "true"
+    emit(f"1. USE_VERTEX enabled: {'✓ YES' if use_vertex else '✗ NO (using OpenAI)'}\n")
+    if not use_vertex:
+        emit("   → Set USE_VERTEX=true in .env to use Vertex AI\n")
+        ctx["exit_code"] = 0
+        return False
+    return True
+
+
+def check_credentials(ctx):
+    """Check 2: Google Application Credentials"""
+    credentials_path = CFG.get("GOOGLE_APPLICATION_CREDENTIALS")
+    if not credentials_path:
+        emit("2. GOOGLE_APPLICATION_CREDENTIALS: ✗ NOT SET\n")
+        emit("   → Set GOOGLE_APPLICATION_CREDENTIALS in .env\n")
+        return False
+
+    emit(f"2. GOOGLE_APPLICATION_CREDENTIALS: {credentials_path}\n")
+
+    # One stat covers existence, file type and size before the single read below
+    try:
+        st = os.stat(credentials_path)
+    except OSError:
+        emit(f"   ✗ File not found at: {credentials_path}\n")
+        return False
+    if not stat.S_ISREG(st.st_mode):
+        emit(f"   ✗ Not a regular file: {credentials_path}\n")
+        return False
+    if st.st_size >= _MAX_CREDS_BYTES:
+        emit(f"   ✗ File too large for a service-account key ({st.st_size} bytes)\n")
+        return False
+
+    emit(f"   ✓ File exists\n")
+
+    # Check if it's a valid JSON (one bytes read, parsed with orjson when available)
+    cached = _CREDS_CACHE.get(credentials_path)
+    if cached is None:
+        try:
+            # Bounded read: a file that grew past the cap after the stat is still rejected unparsed
+            with open(credentials_path, "rb") as f:
+                raw = f.read(_MAX_CREDS_BYTES)
+            if len(raw) >= _MAX_CREDS_BYTES:
+                emit(f"   ✗ File too large for a service-account key (over {_MAX_CREDS_BYTES} bytes)\n")
+                return False
+            cached = _CREDS_CACHE[credentials_path] = {"raw": raw, "creds": _json_loads(raw)}
+        except (OSError, UnicodeDecodeError, _JSONDecodeError) as e:
+            emit(f"   ✗ Invalid JSON file: {e}\n")
+            return False
+    creds = cached["creds"]
+    if not isinstance(creds, dict):
+        emit("   ✗ Invalid JSON file: expected a JSON object\n")
+        return False
+    project_id_from_creds = creds.get('project_id')
+    emit(f"   ✓ Valid JSON file\n")
+    emit(f"   → Project ID in credentials: {project_id_from_creds or 'Not found'}\n")
+    ctx["credentials_path"] = credentials_path
+    # Interned so check 3 can compare it to the configured project by identity
+    ctx["project_id_from_creds"] = sys.intern(project_id_from_creds) if isinstance(project_id_from_creds, str) else project_id_from_creds
+    return True
+
+
+def check_project(ctx):
+    """Check 3: Project ID (falls back to the credentials file, as the Google SDK does)"""
+    env_project = CFG.get("VERTEX_PROJECT") or CFG.get("PROJECT_ID")
+    project_id_from_creds = ctx.get("project_id_from_creds")
+    project = env_project or project_id_from_creds
+    if not project:
+        emit("3. VERTEX_PROJECT: ✗ NOT SET\n")
+        emit("   → Set VERTEX_PROJECT=titanium-portal-476620 (or your project ID) in .env\n")
+        return False
+
+    project = sys.intern(str(project))
+    emit(f"3. VERTEX_PROJECT: {project}\n")
+    if env_project:
+        emit("   ✓ Set\n")
+        # Verify project matches credentials
+        if project_id_from_creds and project_id_from_creds is not project:
+            emit(f"   ⚠ Warning: Project in credentials ({project_id_from_creds}) doesn't match VERTEX_PROJECT ({project})\n")
     else:
-        print(f"   ✗ API call failed: {e}")
-    sys.exit(1)
-
-print()
-print("=" * 60)
-print("✓ All checks passed! Vertex AI is configured correctly.")
-print("=" * 60)
-print()
-print("Configuration summary:")
-print(f"  Project: {project}")
-print(f"  Location: {location}")
-print(f"  Credentials: {credentials_path}")
-print(f"  Embedding Model: {os.getenv('VERTEX_EMBEDDING_MODEL', 'textembedding-gecko@001')}")
-print(f"  Chat Model: {os.getenv('VERTEX_CHAT_MODEL', 'chat-bison@001')}")
-print()
+        emit("   ✓ Using the project from the credentials file\n")
+    ctx["project"] = project
+    return True
+
+
+def check_location(ctx):
+    """Check 4: Location"""
+    location = CFG.get("VERTEX_LOCATION") or CFG.get("REGION") or "us-central1"
+    emit(f"4. VERTEX_LOCATION: {location}\n")
+    emit("   ✓ Set (default: us-central1)\n")
+    ctx["location"] = location
+    return True
+
+
+def check_imports(ctx):
+    """Check 5: Vertex AI imports (deferred until the cheap env checks have passed)"""
+    emit("5. Testing Vertex AI imports...\n")
+    try:
+        from vertexai import init as vertex_init
+        from vertexai.language_models import TextEmbeddingModel
+        from vertexai.generative_models import GenerativeModel
+        from google.api_core.exceptions import Forbidden, PermissionDenied
+        emit("   ✓ Imports successful\n")
+    except ImportError as e:
+        emit(f"   ✗ Import failed: {e}\n")
+        emit("   → Install: pip install google-cloud-aiplatform\n")
+        return False
+    ctx.update(vertex_init=vertex_init, TextEmbeddingModel=TextEmbeddingModel, GenerativeModel=GenerativeModel,
+               permission_errors=(PermissionDenied, Forbidden))  # gRPC / REST flavours of a 403
+    return True
+
+
+def check_init(ctx):
+    """Check 6: Vertex AI initialization"""
+    emit("6. Testing Vertex AI initialization...\n")
+    try:
+        # The SDK reads the credentials from the environment; only written once every earlier check passed
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = ctx["credentials_path"]
+        # Explicit gRPC endpoint (regional, or the bare host for "global"); the models loaded afterwards share it
+        location = ctx["location"]
+        endpoint = "aiplatform.googleapis.com" if location == "global" else f"{location}-aiplatform.googleapis.com"
+        ctx["vertex_init"](project=ctx["project"], location=location, api_transport="grpc", api_endpoint=endpoint)
+        emit("   ✓ Initialization successful\n")
+    except Exception as e:
+        emit(f"   ✗ Initialization failed: {e}\n")
+        emit(_NL)
+        emit("   Common issues:\n")
+        emit("   - Vertex AI API not enabled in Google Cloud Console\n")
+        emit("   - Service account lacks permissions\n")
+        emit("   - Wrong project ID or location\n")
+        emit("   - Insufficient permissions on the service account\n")
+        return False
+    return True
+
+
+def check_models(ctx):
+    """Check 7: Model loading"""
+    emit("7. Testing model loading...\n")
+    try:
+        embedding_model = CFG.get("VERTEX_EMBEDDING_MODEL") or "text-embedding-004"
+        chat_model = CFG.get("VERTEX_CHAT_MODEL") or "gemini-1.5-flash"
+
+        # Both loads and the check 8 probe are independent round-trips, so they overlap
+        pool = ctx["pool"]
+        emb_fut = pool.submit(ctx["TextEmbeddingModel"].from_pretrained, embedding_model)
+        gen_fut = pool.submit(ctx["GenerativeModel"], chat_model)
+
+        emit(f"   → Loading embedding model: {embedding_model}\n")
+        ctx["emb_model"] = emb_fut.result()
+        emit("   ✓ Embedding model loaded\n")
+        ctx["probe_fut"] = pool.submit(ctx["emb_model"].get_embeddings, _PROBE_TEXTS)
+
+        emit(f"   → Loading chat model: {chat_model}\n")
+        ctx["gen_model"] = gen_fut.result()
+        emit("   ✓ Chat model loaded\n")
+    except Exception as e:
+        emit(f"   ✗ Model loading failed: {e}\n")
+        emit("   → Check if models are available in your region\n")
+        return False
+    return True
+
+
+def check_api(ctx):
+    """Check 8: API access with a sample call"""
+    emit("8. Testing API access with sample call...\n")
+    try:
+        test_texts = _PROBE_TEXTS
+        emit(f"   → Getting embeddings for: {test_texts}\n")
+        embeddings = ctx["probe_fut"].result()  # submitted by check 7 as soon as the model loaded
+        if not embeddings or len(embeddings) != len(test_texts):
+            emit(f"   ✗ Expected {len(test_texts)} embeddings, got {len(embeddings or [])}\n")
+            return False
+        dims = {len(e.values) for e in embeddings}
+        if len(dims) != 1 or 0 in dims:
+            emit(f"   ✗ Inconsistent embedding dimensions: {sorted(dims)}\n")
+            return False
+        emit(f"   ✓ Embeddings generated successfully ({len(embeddings)} texts, dimension: {dims.pop()})\n")
+    except ctx["permission_errors"] as e:
+        emit(f"   ✗ Permission denied: {e}\n")
+        emit(_NL)
+        emit("   → Enable Vertex AI API in Google Cloud Console:\n")
+        emit(f"     https://console.cloud.google.com/apis/library/aiplatform.googleapis.com?project={ctx['project']}\n")
+        emit(_NL)
+        emit("   → Grant your service account these roles:\n")
+        emit("     - roles/aiplatform.user\n")
+        emit("     - roles/serviceusage.serviceUsageConsumer\n")
+        return False
+    except Exception as e:
+        emit(f"   ✗ API call failed: {e}\n")
+        return False
+    return True
+
+
+# Run in order and stop at the first failure; the cheap env checks (1-4) come before any SDK import
+CHECKS = [
+    ("USE_VERTEX", check_use_vertex),
+    ("creds_path", check_credentials),
+    ("project", check_project),
+    ("location", check_location),
+    ("imports", check_imports),
+    ("init", check_init),
+    ("models", check_models),
+    ("api", check_api),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify the Vertex AI configuration")
+    parser.add_argument("--json", action="store_true", help="emit one JSON object per check instead of the report")
+    args = parser.parse_args()
+    if args.json:
+        # Only this logger goes to stdout, so SDK log records can't interleave with the JSON lines
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(handler)
+        log.setLevel(logging.INFO)
+        log.propagate = False
+
+    # Load environment variables (python-dotenv is optional; skipped when there is no .env to load)
+    env_file = next((p for p in (Path(".env"), Path(__file__).resolve().parent / ".env") if p.is_file()), None)
+    if env_file is not None:
+        _load_env(env_file)
+    CFG.update((k, os.environ.get(k)) for k in _CFG_KEYS)
+
+    emit(_BAR_LINE)
+    emit("Vertex AI Configuration Verification\n")
+    emit(_BAR_LINE)
+    emit(_NL)
+    if args.json:
+        drain()
+
+    # Worker pool for check 7's model loads and check 8's probe; queued work is dropped on any exit
+    pool = ThreadPoolExecutor(max_workers=3)
+    ctx = {"pool": pool}
+    try:
+        for name, check in CHECKS:
+            ok = check(ctx)
+            if args.json:
+                status = "ok" if ok else ("skipped" if ctx.get("exit_code") == 0 else "failed")
+                log.info(json.dumps({"check": name, "status": status, "messages": drain()}, ensure_ascii=False))
+            else:
+                flush()
+            if not ok:
+                sys.exit(ctx.get("exit_code", 1))
+            emit(_NL)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    embedding_model = CFG.get('VERTEX_EMBEDDING_MODEL') or 'textembedding-gecko@001'
+    chat_model = CFG.get('VERTEX_CHAT_MODEL') or 'chat-bison@001'
+    if args.json:
+        drain()
+        log.info(json.dumps({"check": "summary", "status": "ok", "project": ctx["project"], "location": ctx["location"],
+                             "credentials": ctx["credentials_path"], "embedding_model": embedding_model,
+                             "chat_model": chat_model}, ensure_ascii=False))
+        return
+
+    emit(_BAR_LINE)
+    emit("✓ All checks passed! Vertex AI is configured correctly.\n")
+    emit(_BAR_LINE)
+    emit(_NL)
+    emit("Configuration summary:\n")
+    emit(f"  Project: {ctx['project']}\n")
+    emit(f"  Location: {ctx['location']}\n")
+    emit(f"  Credentials: {ctx['credentials_path']}\n")
+    emit(f"  Embedding Model: {embedding_model}\n")
+    emit(f"  Chat Model: {chat_model}\n")
+    emit(_NL)
+    flush()
+
 
+if __name__ == "__main__":
+    main()